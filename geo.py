@@ -6,9 +6,11 @@
 
         python3 ./geo.py cmd
             [--verbose]
-            [--redis url]                       -- url for redis, default redis://localhost
+            [--redis url]                       -- url for redis, default redis://localhost, repeat
+                                                   to spread shards across several servers
             [--name name]                       -- name of geosearch structure, default "geo"
             [--input file]                      -- file to read coordinates from, or "builtin"
+            [--format fmt]                      -- input format: auto, json, ndjson, or csv
             [--latitude lat] [--longitude lon]  -- specify latitude and longitude to search
             [--radius km]                       -- within radius
             [--width km] [--height km]          -- within a rectangle
@@ -16,22 +18,51 @@
             [--any]                             -- return any of max, rather than closest
             [--descending]                      -- sort in descending order by distance
             [--ascending]                       -- sort in descending order by distance
+            [--batch-size n]                    -- entries per GEOADD when creating, or queries
+                                                   per pipeline round trip for batch-search, default 1000
+            [--queries file]                    -- batch-search query file, ndjson or csv, "-" for stdin
+            [--backend redis|local]             -- local serves from an in-memory index built from --input
+            [--cache-size n]                    -- searches kept in the batch-search result cache, 0 to disable, default 1024
+            [--cache-ttl seconds]               -- how long a cached search stays good, default 60
+            [--concurrency n]                   -- requests kept in flight by create and batch-search, default 4
+            [--shards n]                        -- split the set across n keys, name:0 ... name:n-1, default 1
+            [--output-format fmt]               -- search output: text, ndjson, csv, binary, or members
+            [--output file]                     -- write search output here, default stdout
+            [--shard-by hash|geohash]           -- place members by consistent hash of the name, or by
+                                                   geohash prefix so searches only visit nearby shards
 
         cmd can be:
             "create"    -- will add entries from input file or "builtin"
             "search"    -- will search and print results
+            "batch-search" -- run every query in --queries, writing ndjson results tagged with the query id
+            "sync"      -- bring the set in line with the input file, sending only what changed
             "count"     -- print how many entries there are
             "expunge"   -- delete set
             
     Requires:
     
-        pip install redis[hiredis]
+        pip install redis[hiredis] numpy
 """
 
 import argparse
+import asyncio
+from collections import OrderedDict
+import csv
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import multiprocessing
+import queue
 import redis
+import redis.asyncio
+import struct
 import math
+import numpy as np
+import sys
+import threading
+import time
 
 """builtin data to use, from places to stay in the Presidential Range, NH"""
 Data = [
@@ -103,7 +134,37 @@ Data = [
 ]
 
 Verbose = False
-Redis = redis.from_url("redis://localhost")  # opens lazily so no error if not present
+RedisUrl = "redis://localhost"
+Redis = redis.from_url(RedisUrl)  # opens lazily so no error if not present
+
+BATCH_SIZE = 1000       # members per GEOADD command
+PIPELINE_DEPTH = 16     # GEOADD commands queued before each pipeline round trip
+CONCURRENCY = 4         # pipelines in flight, and pooled connections, for the asyncio client
+READ_SIZE = 1024 * 1024     # characters read at a time when streaming json
+PREFETCH_DEPTH = 8          # parsed chunks buffered ahead of the loader
+FORMATS = ["auto", "json", "ndjson", "csv"]
+EARTH_RADIUS_KM = 6372.7976     # same radius redis uses for GEODIST and GEOSEARCH
+GEO_LAT_LIMIT = 85.05112878     # redis refuses latitudes beyond this
+GEO_STEP = 26                   # bits per axis in redis' 52 bit geohash scores
+UNITS = {"m": 1.0, "km": 1000.0, "mi": 1609.34, "ft": 0.3048}  # meters per unit
+CACHE_SIZE = 1024           # searches kept in the result cache
+CACHE_TTL = 60.0            # seconds a cached search stays good
+CACHE_PRECISION = 5         # decimal places of latitude/longitude in cache keys, about 1m
+VERSION_SUFFIX = ":version"     # per set counter bumped by create and expunge
+SHARD_BY = ["hash", "geohash"]
+SHARD_BITS = 4              # bits per axis of the geohash prefix used to place members
+SCAN_COUNT = 1000           # ZSCAN hint when reading a set back for sync
+OUTPUT_FORMATS = ["text", "ndjson", "csv", "binary", "members"]
+OUTPUT_CHUNK = 4096         # result rows formatted per write
+OUTPUT_BUFFER = 1024 * 1024     # bytes buffered by output files
+PACKED_MAGIC = b"GEOR"
+PACKED_HEADER = struct.Struct("<4sIQ")  # magic, flags, number of results
+PACKED_BEARING = 1                      # flag: a bearing column follows the coordinates
+
+Concurrency = CONCURRENCY
+RedisUrls = [RedisUrl]      # shards go round robin across these
+ShardCount = 1
+ShardBy = "hash"
 
 
 def main():
@@ -111,14 +172,15 @@ def main():
         parse arguments, do minimal error checking, dispatch to respective
         functions ( create(), search(), expunge(), and count() ) to do actual work.
     """
-    global Verbose, Redis
+    global Verbose, Redis, RedisUrl, RedisUrls, Cache, Concurrency, ShardCount, ShardBy
 
     ap = argparse.ArgumentParser()
     ap.add_argument("command", type=str, nargs=1)
     ap.add_argument("--verbose", action='store_true', default=False)
-    ap.add_argument("--redis", type=str, required=False)
+    ap.add_argument("--redis", type=str, required=False, action='append')
     ap.add_argument("--name", type=str, default="geo")
     ap.add_argument("--input", type=str, default="builtin")
+    ap.add_argument("--format", type=str, default="auto", choices=FORMATS)
     ap.add_argument("--latitude", type=float, required=False)
     ap.add_argument("--longitude", type=float, required=False)
     ap.add_argument("--radius", type=float, required=False)
@@ -129,45 +191,200 @@ def main():
     ap.add_argument("--descending", action='store_true', default=False)
     ap.add_argument("--ascending", action='store_true', default=False)
     ap.add_argument("--bearing", action='store_true', default=False)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--queries", type=str, default="-")
+    ap.add_argument("--backend", type=str, default="redis", choices=["redis", "local"])
+    ap.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    ap.add_argument("--cache-ttl", type=float, default=CACHE_TTL)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--output-format", type=str, default="text", choices=OUTPUT_FORMATS)
+    ap.add_argument("--output", type=str, default=None)
+    ap.add_argument("--shards", type=int, default=1)
+    ap.add_argument("--shard-by", type=str, default="hash", choices=SHARD_BY)
 
     args = ap.parse_args()
     cmd = args.command[0]
 
-    if cmd not in ["create", "search", "count", "expunge"]:
+    if cmd not in ["create", "sync", "search", "batch-search", "count", "expunge"]:
         print(f"[error] Invalid command {cmd}")
         exit(1)
 
+    if args.batch_size < 1:
+        print(f"[error] --batch-size must be at least 1")
+        exit(1)
+
+    if args.concurrency < 1:
+        print(f"[error] --concurrency must be at least 1")
+        exit(1)
+
+    if args.shards < 1:
+        print(f"[error] --shards must be at least 1")
+        exit(1)
+
     Verbose = args.verbose
+    Concurrency = args.concurrency
+    Cache = SearchCache(args.cache_size, args.cache_ttl)
+    ShardCount = args.shards
+    ShardBy = args.shard_by
 
-    if args.redis:
-        Redis = redis.from_url(args['redis'])
+    if args.backend == "local":
+        # nothing persists between runs, so every command starts from --input
+        Redis = LocalGeo()
+
+        if cmd != "create":
+            if args.input == "builtin":
+                entries = Data
+            else:
+                entries = prefetch(read_entries(args.input, args.format))
+
+            asyncio.run(with_client(async_load_data, args.name, entries))
+    elif args.redis:
+        RedisUrls = args.redis
+        RedisUrl = RedisUrls[0]
+        Redis = redis.from_url(RedisUrl)
 
     if cmd == "create":
-        create(args.name, args.input)
+        create(args.name, args.input, batch_size=args.batch_size, fmt=args.format)
+    elif cmd == "sync":
+        sync(args.name, args.input, batch_size=args.batch_size, fmt=args.format)
     elif cmd == "count":
         count(args.name)
     elif cmd == "search":
         search(args)
+    elif cmd == "batch-search":
+        batch_search(args)
     elif cmd == "expunge":
         expunge(args.name)
 
 
-def create(name, source):
+def create(name, source, batch_size=BATCH_SIZE, fmt="auto"):
+    """
+        create redis geo object, see async_create()
+
+    :param name: name of redis geo object
+    :param source: source to read from, json/ndjson/csv/geojson file or "builtin"
+    :param batch_size: entries sent per GEOADD command
+    :param fmt: input format, see read_entries()
+    """
+
+    start = time.perf_counter()
+
+    if ShardCount > 1 and not isinstance(Redis, LocalGeo):
+        added = load_shards(name, source, batch_size=batch_size, fmt=fmt)
+    else:
+        added = asyncio.run(with_client(
+            async_create, name, source, batch_size=batch_size, fmt=fmt, concurrency=Concurrency
+        ))
+
+    elapsed = time.perf_counter() - start
+    rate = added / elapsed if elapsed > 0 else 0.0
+
+    print(f"{added} entries loaded into {name}:  {elapsed:.3f} seconds, {rate:.0f} points/sec")
+
+    return added
+
+
+async def async_create(client, name, source, batch_size=BATCH_SIZE, fmt="auto", concurrency=CONCURRENCY):
     """
         create redis geo object
 
+        input files are parsed incrementally on a background thread while
+        the loader sends to redis, so memory use doesn't grow with file size.
+
+    :param client: asyncio redis client, see async_client()
     :param name: name of redis geo object
-    :param source: source to read from, json file or "builtin"
+    :param source: source to read from, json/ndjson/csv/geojson file or "builtin"
+    :param batch_size: entries sent per GEOADD command
+    :param fmt: input format, see read_entries()
+    :param concurrency: pipelines kept in flight
+    :return: number of entries sent
     """
 
     if source == "builtin":
         global Data
-        return load_data(name, Data)
+        entries = Data
     else:
-        with open(source, 'r') as f:
-            stuff = json.load(f)
+        entries = prefetch(read_entries(source, fmt))
+
+    added = await async_load_data(client, name, entries, batch_size=batch_size, concurrency=concurrency)
+    await client.incr(name + VERSION_SUFFIX)
+
+    return added
+
+
+def sync(name, source, batch_size=BATCH_SIZE, fmt="auto"):
+    """
+        make the geo object match source without reloading it.  the set is
+        read back with ZSCAN; a member's score is its 52 bit geohash, so
+        computing that score for each input entry tells us whether the
+        member moved.  only new or moved entries are sent with GEOADD and
+        members missing from source are dropped with ZREM.
+
+    :param name: name of redis geo object
+    :param source: source to read from, json/ndjson/csv/geojson file or "builtin"
+    :param batch_size: entries sent per GEOADD or ZREM command
+    :param fmt: input format, see read_entries()
+    :return: tuple of (added or moved, removed, unchanged)
+    """
+    start = time.perf_counter()
+    keys = shard_keys(name)
+    writers = [_Batcher(sync_client(url), key, batch_size) for url, key in keys]
+    existing = {}
 
-        return load_data(name, stuff)
+    for idx, (url, key) in enumerate(keys):
+        for member, score in sync_client(url).zscan_iter(key, count=SCAN_COUNT):
+            existing[member] = (idx, int(score))
+
+    if Verbose:
+        print(f"[info] {len(existing)} entries in {name} before sync", file=sys.stderr)
+
+    if source == "builtin":
+        entries = Data
+    else:
+        entries = prefetch(read_entries(source, fmt))
+
+    added = unchanged = 0
+
+    for ent in entries:
+        what = ent['name']
+        lat = float(ent['latitude'])
+        lon = float(ent['longitude'])
+        member = what.encode('utf-8') if isinstance(what, str) else what
+        idx = shard_of(lat, lon, member) if len(keys) > 1 else 0
+        was = existing.pop(member, None)
+
+        if was == (idx, geohash_score(lat, lon)):
+            unchanged += 1
+            continue
+
+        if was is not None and was[0] != idx:
+            # moved to another shard
+            writers[was[0]].remove(member)
+
+        if Verbose:
+            print(f"Adding: {what} at {lat:.5f},{lon:.5f}", file=sys.stderr)
+
+        writers[idx].add(lon, lat, what)
+        added += 1
+
+    for member, (idx, score) in existing.items():
+        if Verbose:
+            print(f"Removing: {member.decode('utf-8')}", file=sys.stderr)
+
+        writers[idx].remove(member)
+
+    for writer in writers:
+        writer.flush()
+
+    removed = len(existing)
+
+    if added or removed:
+        Redis.incr(name + VERSION_SUFFIX)
+
+    elapsed = time.perf_counter() - start
+    print(f"{name} synced:  {added} added or moved, {removed} removed, {unchanged} unchanged, {elapsed:.3f} seconds")
+
+    return added, removed, unchanged
 
 
 def count(name):
@@ -176,11 +393,21 @@ def count(name):
 
     :param name: name of geo object in redis to count
     """
-    rc = Redis.zcard(name)
+    rc = asyncio.run(with_client(async_count, name))
 
     print(f"{rc} entries in {name}")
 
 
+async def async_count(client, name):
+    """
+    number of entries in redis geo object
+
+    :param client: asyncio redis client, see async_client()
+    :param name: name of geo object in redis to count
+    """
+    return await client.zcard(name)
+
+
 def expunge(name):
     """
         removes a sorted set we don't need anymore
@@ -191,15 +418,20 @@ def expunge(name):
     if Verbose:
         print(f"[info] Deleting {name}")
 
-    Redis.delete(name)
+    for url, key in shard_keys(name):
+        sync_client(url).delete(key)
+
+    Redis.incr(name + VERSION_SUFFIX)
 
 
 def search(args):
     """
-        do redis geo search operation and print results, one per line
+        do redis geo search operation and write the results, see write_results()
 
     :param args: -- parsed arguments
     """
+    # keep instrumentation out of machine readable output
+    info = sys.stdout if args.output_format == "text" else sys.stderr
     lat = args.latitude
     lon = args.longitude
 
@@ -208,14 +440,7 @@ def search(args):
         exit(1)
 
     radius = args.radius
-
-    sorting = None
-
-    if args.ascending:
-        sorting = 'ASC'
-
-    if args.descending:
-        sorting = 'DESC'
+    sorting = get_sorting(args)
 
     if radius is None:
         h = args.height
@@ -225,44 +450,455 @@ def search(args):
             print(f"[error] Must specify both --width and --height or --radius")
             exit(1)
 
-        results = Redis.geosearch(
-            args.name, latitude=lat, longitude=lon, width=w, height=h, unit='km',
-            sort=sorting, count=args.count, any=args.any,
-            withcoord=True, withdist=True
-        )
+        query = dict(latitude=lat, longitude=lon, width=w, height=h, count=args.count)
     else:
         if Verbose:
-            print(f"[info] For radius {radius:.3f}km")
-        results = Redis.geosearch(
-            args.name, latitude=lat, longitude=lon, radius=radius, unit='km',
-            sort=sorting, count=args.count, any=args.any,
-            withcoord=True, withdist=True
+            print(f"[info] For radius {radius:.3f}km", file=info)
+        query = dict(latitude=lat, longitude=lon, radius=radius, count=args.count)
+
+    raw = args.output_format == "members"
+    # a cache that dies with this one search could never hit, don't pay the version lookup for it
+    results = asyncio.run(with_client(async_search, args.name, query, sorting, args.any, raw=raw, cached=False))
+
+    if Verbose:
+        print(f"[info] from {lat:.5f},{lon:.5f}, {len(results)} entries found", file=info)
+
+    write_results(results, args)
+
+
+async def async_search(client, name, query, sorting=None, any_=False, raw=False, cached=True):
+    """
+        one geo search through the result cache
+
+    :param client: asyncio redis client, see async_client()
+    :param name: name of geo object
+    :param query: geosearch keyword arguments, latitude, longitude, radius or width and height, count
+    :param sorting: 'ASC', 'DESC', or None
+    :param any_: return any count entries rather than the closest
+    :param raw: only fetch member names, skipping distances and coordinates
+    :param cached: False goes straight to redis, without the cache or its version lookup
+    :return: geosearch results, withdist and withcoord with distances in km, or just members if raw
+    """
+    if not cached:
+        return await client.geosearch(
+            name, **query, unit='km', sort=sorting, any=any_,
+            withcoord=not raw, withdist=not raw
+        )
+
+    version = await Cache.version(client, name)
+    key = Cache.key(name, query, sorting, any_, raw)
+    results = Cache.get(key, version)
+
+    if results is None:
+        results = await client.geosearch(
+            name, **query, unit='km', sort=sorting, any=any_,
+            withcoord=not raw, withdist=not raw
         )
+        Cache.put(key, version, results)
+
+    return results
+
+
+def get_sorting(args):
+    """returns the geosearch sort order asked for in args, or None"""
+    sorting = None
+
+    if args.ascending:
+        sorting = 'ASC'
+
+    if args.descending:
+        sorting = 'DESC'
+
+    return sorting
+
+
+def batch_search(args):
+    """
+        run many searches in one invocation, see async_batch_search()
+
+    :param args: -- parsed arguments
+    """
+    start = time.perf_counter()
+    total = asyncio.run(with_client(async_batch_search, args, concurrency=Concurrency))
 
     if Verbose:
-        print(f"[info] from {lat:.5f},{lon:.5f}, {len(results)} entries found")
+        elapsed = time.perf_counter() - start
+        print(f"[info] {total} queries in {elapsed:.3f} seconds", file=sys.stderr)
+        print(f"[info] cache: {Cache.hits} hits, {Cache.misses} misses", file=sys.stderr)
+
+
+async def async_batch_search(client, args, out=None, concurrency=CONCURRENCY):
+    """
+        run many searches in one invocation.  queries are read from
+        args.queries and sent as pipelined GEOSEARCH commands, args.batch_size
+        per round trip with up to concurrency round trips in flight, and each
+        query's results are written as one ndjson line as soon as its chunk
+        comes back, so lines may come out of order.
+
+        each query needs latitude and longitude and may carry an id plus
+        radius, width, height, and count to override the command line.
+        queries without an id are numbered from 0.
+
+    :param client: asyncio redis client, see async_client()
+    :param args: -- parsed arguments
+    :param out: file to write results to, default stdout
+    :param concurrency: pipelines kept in flight
+    :return: number of queries run
+    """
+    sorting = get_sorting(args)
+    out = out or sys.stdout
+
+    async def run(chunk):
+        # one version check per chunk, then only cache misses go to redis
+        version = await Cache.version(client, args.name)
+        keys = [Cache.key(args.name, query, sorting, args.any) for qid, query in chunk]
+        answers = [Cache.get(key, version) for key in keys]
+        pipe = client.pipeline(transaction=False)
+
+        for (qid, query), results in zip(chunk, answers):
+            if results is None:
+                pipe.geosearch(args.name, **query, unit='km', sort=sorting, any=args.any,
+                               withcoord=True, withdist=True)
+
+        fetched = iter(await pipe.execute())
+
+        for idx, key in enumerate(keys):
+            if answers[idx] is None:
+                answers[idx] = next(fetched)
+                Cache.put(key, version, answers[idx])
+
+        lines = []
+        for (qid, query), results in zip(chunk, answers):
+            found = [
+                {
+                    "name": what.decode('utf-8'),
+                    "distance": distance,
+                    "latitude": lat,
+                    "longitude": lon,
+                }
+                for what, distance, (lon, lat) in results
+            ]
+
+            if args.bearing and found:
+                origin = (query['latitude'], query['longitude'])
+                points = [(ent['latitude'], ent['longitude']) for ent in found]
+                for ent, degrees in zip(found, bearings(origin, points).tolist()):
+                    ent['bearing'] = degrees
+
+            lines.append(json.dumps({"id": qid, "results": found}) + "\n")
+
+        out.write("".join(lines))
+        out.flush()
+
+        return len(chunk)
+
+    return sum(await in_flight(run, read_queries(args.queries, args), args.batch_size, concurrency))
+
+
+def read_queries(source, args):
+    """
+    generates (id, geosearch keyword arguments) for each query in source
+
+    :param source: ndjson or csv file name (by extension), "-" for ndjson on stdin
+    :param args: parsed arguments, supplies defaults for radius, width, height, and count
+    """
+    if source == "-":
+        rows = (json.loads(line) for line in sys.stdin if line.strip())
+        yield from _queries(rows, args)
+    elif source.lower().endswith(".csv"):
+        with open(source, 'r', newline='') as f:
+            rows = ({k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f))
+            yield from _queries(rows, args)
+    else:
+        with open(source, 'r') as f:
+            rows = (json.loads(line) for line in f if line.strip())
+            yield from _queries(rows, args)
+
+
+def _queries(rows, args):
+    for idx, row in enumerate(rows):
+        query = {
+            "latitude": float(row['latitude']),
+            "longitude": float(row['longitude']),
+        }
+
+        # a box in the query wins over a radius from the command line
+        if 'radius' not in row and 'width' in row and 'height' in row:
+            radius = None
+        else:
+            radius = row.get('radius', args.radius)
+
+        width = row.get('width', args.width)
+        height = row.get('height', args.height)
+        count = row.get('count', args.count)
+
+        if radius is not None:
+            query['radius'] = float(radius)
+        elif width is not None and height is not None:
+            query['width'] = float(width)
+            query['height'] = float(height)
+        else:
+            raise ValueError(f"query {row.get('id', idx)} needs a radius or both width and height")
 
-    print_search(results, args)
+        if count is not None:
+            query['count'] = int(count)
 
+        yield row.get('id', idx), query
 
-def print_search(results, args):
+
+class SearchCache:
+    """
+    read-through LRU cache of geosearch results with a time to live.
+
+    entries remember the version counter of their set when they were
+    fetched; create and expunge bump the counter in redis, so anything
+    cached before a change no longer matches and is refetched.
+    """
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name, query, sorting, any_, raw=False):
+        """cache key for a geosearch, latitude and longitude rounded to CACHE_PRECISION"""
+        return (
+            name,
+            round(query['latitude'], CACHE_PRECISION),
+            round(query['longitude'], CACHE_PRECISION),
+            query.get('radius'), query.get('width'), query.get('height'),
+            sorting, query.get('count'), any_, raw,
+        )
+
+    async def version(self, client, name):
+        """current version counter of a set, skips the round trip when caching is off"""
+        if self.size <= 0:
+            return None
+        return await client.get(name + VERSION_SUFFIX)
+
+    def get(self, key, version):
+        """cached results for key, or None if missing, stale, or expired"""
+        if self.size <= 0:
+            return None
+
+        ent = self.entries.get(key)
+
+        if ent is None or ent[0] != version or ent[1] < time.monotonic():
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return ent[2]
+
+    def put(self, key, version, results):
+        if self.size <= 0:
+            return
+
+        self.entries[key] = (version, time.monotonic() + self.ttl, results)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+Cache = SearchCache()
+
+
+def write_results(results, args):
+    """
+        writes results from Redis.geosearch() to args.output, or stdout,
+        in args.output_format:
+
+            "text"    -- the human readable lines print_search() makes
+            "ndjson"  -- one json object per result
+            "csv"     -- header row, then name, distance, latitude, longitude
+            "binary"  -- packed arrays, see write_packed()
+            "members" -- raw member names, one per line, never decoded
+
+        rows are formatted OUTPUT_CHUNK at a time into large writes, and
+        bearings and packed columns are numpy arrays filled in one pass, so
+        output adds little on top of the results.  those are still the whole
+        GEOSEARCH reply in memory: redis-py parses a reply completely before
+        handing it back, so a huge --count costs its full size once.
+
+    :param results: from Redis.geosearch(), just members for "members"
+    :param args:  from argparse
+    """
+    fmt = args.output_format
+    binary = fmt in ["binary", "members"]
+
+    if args.output:
+        out = open(args.output, 'wb' if binary else 'w', buffering=OUTPUT_BUFFER, newline='' if fmt == "csv" else None)
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+
+    try:
+        if fmt == "members":
+            for i in range(0, len(results), OUTPUT_CHUNK):
+                out.write(b"\n".join(results[i:i + OUTPUT_CHUNK]) + b"\n")
+        elif fmt == "binary":
+            write_packed(out, results, _bearings_for(results, args))
+        elif fmt == "text":
+            print_search(results, args, out)
+        else:
+            degrees = _bearings_for(results, args)
+
+            for i in range(0, len(results), OUTPUT_CHUNK):
+                rows = _rows(results[i:i + OUTPUT_CHUNK],
+                             degrees[i:i + OUTPUT_CHUNK].tolist() if degrees is not None else None)
+
+                if fmt == "ndjson":
+                    out.write("".join(json.dumps(row) + "\n" for row in rows))
+                else:
+                    text = io.StringIO(newline='')
+                    writer = csv.DictWriter(text, fieldnames=_csv_fields(args), lineterminator="\n")
+
+                    if i == 0:
+                        writer.writeheader()
+
+                    writer.writerows(rows)
+                    out.write(text.getvalue())
+
+            if fmt == "csv" and not results:
+                out.write(",".join(_csv_fields(args)) + "\n")
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+
+
+def _csv_fields(args):
+    fields = ["name", "distance", "latitude", "longitude"]
+    return fields + ["bearing"] if args.bearing else fields
+
+
+def _coordinates(results):
+    """n x 2 array of (latitude, longitude) of each result, filled straight from results"""
+    n = len(results)
+    flat = np.fromiter(itertools.chain.from_iterable(ent[2] for ent in results), dtype=np.float64, count=2 * n)
+    return flat.reshape(n, 2)[:, ::-1]
+
+
+def _bearings_for(results, args):
+    """numpy array of bearings to each result if args.bearing, else None"""
+    if not args.bearing or not results:
+        return None
+
+    return bearings((args.latitude, args.longitude), _coordinates(results))
+
+
+def _rows(results, degrees):
+    rows = []
+
+    for idx, (what, distance, (lon, lat)) in enumerate(results):
+        row = {"name": what.decode('utf-8'), "distance": distance, "latitude": lat, "longitude": lon}
+
+        if degrees is not None:
+            row['bearing'] = degrees[idx]
+
+        rows.append(row)
+
+    return rows
+
+
+def write_packed(out, results, degrees=None):
+    """
+    writes results as one packed binary record, little endian:
+
+        header      -- PACKED_HEADER: b"GEOR", flags, n
+        offsets     -- n + 1 uint64 byte offsets into the names blob
+        names       -- utf-8 member names back to back
+        distance    -- n float64, km
+        latitude    -- n float64
+        longitude   -- n float64
+        bearing     -- n float64 degrees, only if flags has PACKED_BEARING
+
+    :param out: binary file
+    :param results: from Redis.geosearch() withdist and withcoord
+    :param degrees: bearings to each result, or None
+    """
+    n = len(results)
+    offsets = np.zeros(n + 1, dtype='<u8')
+    np.cumsum(np.fromiter((len(ent[0]) for ent in results), dtype='<u8', count=n), out=offsets[1:])
+    coordinates = _coordinates(results)
+
+    out.write(PACKED_HEADER.pack(PACKED_MAGIC, PACKED_BEARING if degrees is not None else 0, n))
+    out.write(offsets.tobytes())
+
+    for i in range(0, n, OUTPUT_CHUNK):
+        out.write(b"".join(ent[0] for ent in results[i:i + OUTPUT_CHUNK]))
+
+    out.write(np.fromiter((ent[1] for ent in results), dtype='<f8', count=n).tobytes())
+    out.write(np.ascontiguousarray(coordinates[:, 0], dtype='<f8').tobytes())
+    out.write(np.ascontiguousarray(coordinates[:, 1], dtype='<f8').tobytes())
+
+    if degrees is not None:
+        out.write(np.asarray(degrees, dtype='<f8').tobytes())
+
+
+def read_packed(data):
+    """
+    decodes write_packed() output
+
+    :param data: bytes
+    :return: dict of names (list of bytes) and numpy arrays distance, latitude, longitude, maybe bearing
+    """
+    magic, flags, n = PACKED_HEADER.unpack_from(data)
+
+    if magic != PACKED_MAGIC:
+        raise ValueError("not packed geo results")
+
+    pos = PACKED_HEADER.size
+    offsets = np.frombuffer(data, dtype='<u8', count=n + 1, offset=pos)
+    pos += offsets.nbytes
+    blob = data[pos:pos + int(offsets[-1])]
+    pos += len(blob)
+
+    rc = {"names": [blob[offsets[i]:offsets[i + 1]] for i in range(n)]}
+    columns = ["distance", "latitude", "longitude"]
+
+    if flags & PACKED_BEARING:
+        columns.append("bearing")
+
+    for column in columns:
+        rc[column] = np.frombuffer(data, dtype='<f8', count=n, offset=pos)
+        pos += 8 * n
+
+    return rc
+
+
+def print_search(results, args, out=None):
     """
         prints results from Redis.geosearch()
 
     :param results: from Redis.geosearch()
     :param args:  from argparse
+    :param out: text file to write to, default stdout
     """
-    for ent in results:
-        what, distance, loc = ent
-        what = what.decode('utf-8')
-        lon, lat = loc
-        out = f"{what}:  {distance:.3f} km at {lat:.5f},{lon:.5f}"
+    out = out or sys.stdout
+    degrees = _bearings_for(results, args)
+
+    for i in range(0, len(results), OUTPUT_CHUNK):
+        lines = []
+        chunk = degrees[i:i + OUTPUT_CHUNK].tolist() if degrees is not None else None
+
+        for idx, ent in enumerate(results[i:i + OUTPUT_CHUNK]):
+            what, distance, loc = ent
+            what = what.decode('utf-8')
+            lon, lat = loc
+            line = f"{what}:  {distance:.3f} km at {lat:.5f},{lon:.5f}"
 
-        if args.bearing:
-            degrees = bearing((args.latitude, args.longitude), (lat, lon))
-            out += f" at {degrees} degrees"
+            if chunk is not None:
+                line += f" at {chunk[idx]} degrees"
 
-        print(out)
+            lines.append(line + "\n")
+
+        out.write("".join(lines))
 
 
 def bearing(p1, p2):
@@ -299,22 +935,1079 @@ def bearing(p1, p2):
     return rc
 
 
-def load_data(name, entries):
+def bearings(origin, points):
     """
-    load geospatial data from a list of dicts
+    vectorized bearing() from origin to every point, same truncation and
+    0-360 wrap as the scalar version
 
-    :param name: redis geo name
-    :param entries: list of dicts
+    :param origin: starting position -- tuple latitude longitude
+    :param points: array-like of shape (n, 2), latitude longitude per row
+    :return: numpy int array of bearings (degrees)
     """
-    for ent in entries:
-        what = ent['name']
-        lat = ent['latitude']
-        lon = ent['longitude']
+    lat_1, lon_1 = math.radians(origin[0]), math.radians(origin[1])
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat_2 = points[:, 0]
+    delta_l = points[:, 1] - lon_1
+
+    cos_lat_2 = np.cos(lat_2)
+    x = cos_lat_2 * np.sin(delta_l)
+    y = math.cos(lat_1) * np.sin(lat_2) - math.sin(lat_1) * cos_lat_2 * np.cos(delta_l)
+
+    rc = np.degrees(np.arctan2(x, y)).astype(np.int64)     # truncates toward zero like int()
+    rc[rc < 0] += 360
+
+    return rc
+
+
+def distances(origin, points):
+    """
+    vectorized haversine distances (km) from origin to every point
+
+    :param origin: starting position -- tuple latitude longitude
+    :param points: array-like of shape (n, 2), latitude longitude per row
+    :return: numpy float array of distances (km)
+    """
+    lat_1, lon_1 = math.radians(origin[0]), math.radians(origin[1])
+    points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat_2 = points[:, 0]
+
+    u = np.sin((lat_2 - lat_1) / 2)
+    v = np.sin((points[:, 1] - lon_1) / 2)
+    a = u * u + math.cos(lat_1) * np.cos(lat_2) * v * v
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def read_entries(source, fmt="auto"):
+    """
+    generates entry dicts (name, latitude, longitude) from an input file
+    without reading the whole file into memory
+
+    formats:
+        "json"   -- a list of entry dicts, or a GeoJSON FeatureCollection of Points
+        "ndjson" -- one entry dict (or GeoJSON Feature) per line
+        "csv"    -- header row with name, latitude, and longitude columns
+        "auto"   -- pick from the file extension, json if nothing matches
+
+    :param source: file name
+    :param fmt: one of FORMATS
+    """
+    if fmt == "auto":
+        ext = source.lower().rsplit('.', 1)[-1]
 
+        if ext == "csv":
+            fmt = "csv"
+        elif ext in ["ndjson", "jsonl"]:
+            fmt = "ndjson"
+        else:
+            fmt = "json"
+
+    if fmt == "csv":
+        with open(source, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                yield {
+                    "name": row['name'],
+                    "latitude": float(row['latitude']),
+                    "longitude": float(row['longitude']),
+                }
+    elif fmt == "ndjson":
+        with open(source, 'r') as f:
+            for line in f:
+                if line.strip():
+                    ent = _entry(json.loads(line))
+                    if ent is not None:
+                        yield ent
+    elif fmt == "json":
+        with open(source, 'r') as f:
+            for item in _JsonStream(f).items():
+                ent = _entry(item)
+                if ent is not None:
+                    yield ent
+    else:
+        raise ValueError(f"unknown input format {fmt}")
+
+
+def _entry(item):
+    """
+    normalizes a parsed item to an entry dict, accepting either our own
+    entry dicts or GeoJSON Point features.  returns None for anything
+    else (lines, polygons, ...)
+    """
+    if item.get('type') != "Feature":
+        return item
+
+    geometry = item.get('geometry') or {}
+
+    if geometry.get('type') != "Point":
         if Verbose:
-            print(f"Adding: {what} at {lat:.5f},{lon:.5f}")
+            print(f"[info] Skipping {geometry.get('type')} feature", file=sys.stderr)
+        return None
+
+    props = item.get('properties') or {}
+    lon, lat = geometry['coordinates'][:2]
+
+    return {
+        "name": props.get('name', item.get('id')),
+        "latitude": lat,
+        "longitude": lon,
+    }
+
+
+class _JsonStream:
+    """
+    minimal incremental json reader -- walks a top level array, or the
+    "features" array of a top level object, decoding one element at a time
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """read more text, dropping what we've already consumed"""
+        more = self.f.read(READ_SIZE)
+        self.buf = self.buf[self.pos:] + more
+        self.pos = 0
+        return bool(more)
+
+    def _peek(self):
+        """returns next non-whitespace character without consuming it, "" at eof"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        ch = self._peek()
+        if ch == "" or ch not in chars:
+            raise ValueError(f"malformed json: expected one of {chars!r}, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def _value(self):
+        """decode one complete json value, reading more text until it parses"""
+        self._peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+
+            # a number could continue past the end of the buffer
+            if end == len(self.buf) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def _array(self):
+        self._expect("[")
+
+        if self._peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield self._value()
+
+            if self._expect(",]") == "]":
+                return
+
+    def items(self):
+        ch = self._peek()
+
+        if ch == "[":
+            yield from self._array()
+            return
+
+        self._expect("{")
+
+        if self._peek() == "}":
+            return
+
+        while True:
+            key = self._value()
+            self._expect(":")
+
+            if key == "features" and self._peek() == "[":
+                yield from self._array()
+            else:
+                self._value()
+
+            if self._expect(",}") == "}":
+                return
+
+
+def prefetch(entries, chunk=BATCH_SIZE, depth=PREFETCH_DEPTH):
+    """
+    runs the entries generator on a background thread, handing chunks of
+    entries over a bounded queue, so parsing overlaps the redis writes
+
+    :param entries: iterable of entry dicts
+    :param chunk: entries handed over at a time
+    :param depth: chunks allowed to queue up before the reader waits
+    """
+    q = queue.Queue(maxsize=depth)
+    done = object()
+
+    def reader():
+        try:
+            block = []
+            for ent in entries:
+                block.append(ent)
+                if len(block) >= chunk:
+                    q.put(block)
+                    block = []
+            if block:
+                q.put(block)
+            q.put(done)
+        except Exception as e:
+            q.put(e)
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    while True:
+        block = q.get()
+
+        if block is done:
+            return
+
+        if isinstance(block, Exception):
+            raise block
+
+        yield from block
+
+
+def async_client(url=None):
+    """
+    new asyncio client for the current event loop, drawing on a pool of at
+    most Concurrency connections; callers wait for a free connection
+    rather than opening more.  the local backend gets a thin async shim.
+
+    without a url, and with more than one shard, this is a _ShardedAsync
+    spreading geo sets over clients for each of RedisUrls.
+
+    :param url: redis url, default RedisUrl
+    """
+    if url is None and ShardCount > 1:
+        return _ShardedAsync({u: async_client(u) for u in RedisUrls})
+
+    if isinstance(Redis, LocalGeo):
+        return _AsyncLocal(Redis)
+
+    pool = redis.asyncio.BlockingConnectionPool.from_url(url or RedisUrl, max_connections=Concurrency)
+    return redis.asyncio.Redis.from_pool(pool)
+
+
+def sync_client(url):
+    """synchronous client for url, Redis itself where possible"""
+    if url == RedisUrl or isinstance(Redis, LocalGeo):
+        return Redis
+    return redis.from_url(url)
+
+
+async def with_client(fn, *args, **kwargs):
+    """runs fn(client, *args, **kwargs) with a fresh async_client(), closing it afterwards"""
+    client = async_client()
+
+    try:
+        return await fn(client, *args, **kwargs)
+    finally:
+        await client.aclose()
+
+
+def _take(it, n):
+    return list(itertools.islice(it, n))
+
+
+async def in_flight(fn, items, size, concurrency):
+    """
+    calls coroutine fn on successive lists of up to size items, with at
+    most concurrency calls running at once.  items are pulled on a worker
+    thread so a slow reader doesn't stall the event loop, and the next list
+    is read while earlier calls are still waiting on redis.
+
+    :return: list of fn results, in completion order
+    """
+    it = iter(items)
+    pending = set()
+    results = []
+
+    while True:
+        block = await asyncio.to_thread(_take, it, size)
+
+        if not block:
+            break
+
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            results.extend(task.result() for task in done)
+
+        pending.add(asyncio.create_task(fn(block)))
+
+    if pending:
+        results.extend(await asyncio.gather(*pending))
+
+    return results
+
+
+async def async_load_data(client, name, entries, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    """
+    asyncio load_data(), keeping up to concurrency pipelines of
+    PIPELINE_DEPTH multi-member GEOADD commands in flight
+
+    :param client: asyncio redis client, see async_client()
+    :param name: redis geo name
+    :param entries: iterable of dicts
+    :param batch_size: entries sent per GEOADD command
+    :param concurrency: pipelines kept in flight
+    :return: number of entries sent
+    """
+
+    async def send(block):
+        pipe = client.pipeline(transaction=False)
+
+        for i in range(0, len(block), batch_size):
+            values = []
+
+            for ent in block[i:i + batch_size]:
+                what = ent['name']
+                lat = ent['latitude']
+                lon = ent['longitude']
+
+                if Verbose:
+                    print(f"Adding: {what} at {lat:.5f},{lon:.5f}", file=sys.stderr)
+
+                values.extend((lon, lat, what))
+
+            pipe.geoadd(name, values)
+
+        await pipe.execute()
+
+        return len(block)
+
+    return sum(await in_flight(send, entries, batch_size * PIPELINE_DEPTH, concurrency))
+
+
+def shard_keys(name):
+    """(url, key) for each shard of name, just (RedisUrl, name) when not sharded"""
+    if ShardCount <= 1:
+        return [(RedisUrl, name)]
+
+    return [(RedisUrls[i % len(RedisUrls)], f"{name}:{i}") for i in range(ShardCount)]
+
+
+def _jump_hash(key, buckets):
+    """jump consistent hash (Lamping and Veach), moves few keys when buckets changes"""
+    b, j = -1, 0
+
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+
+    return b
+
+
+def _cell(lat, lon):
+    """geohash prefix cell, SHARD_BITS per axis, as (latitude index, longitude index)"""
+    cells = 1 << SHARD_BITS
+    lat_i = int((lat + GEO_LAT_LIMIT) / (2 * GEO_LAT_LIMIT) * cells)
+    lon_i = int((lon + 180) / 360 * cells)
+
+    return min(max(lat_i, 0), cells - 1), min(max(lon_i, 0), cells - 1)
+
+
+def _cell_shard(lat_i, lon_i):
+    # interleave the bits like a geohash so neighbouring cells land on different shards
+    prefix = 0
+
+    for bit in range(SHARD_BITS):
+        prefix |= ((lon_i >> bit) & 1) << (2 * bit + 1)
+        prefix |= ((lat_i >> bit) & 1) << (2 * bit)
+
+    return prefix % ShardCount
+
+
+def shard_of(lat, lon, member):
+    """index of the shard holding member at lat, lon"""
+    if ShardBy == "geohash":
+        return _cell_shard(*_cell(float(lat), float(lon)))
+
+    if isinstance(member, str):
+        member = member.encode('utf-8')
+
+    digest = hashlib.blake2b(member, digest_size=8).digest()
+    return _jump_hash(int.from_bytes(digest, 'little'), ShardCount)
+
+
+def shards_for(query):
+    """
+    indexes of the shards a geosearch could find members in.  consistent
+    hashing spreads every area over all shards; geohash placement only
+    needs the shards of prefix cells overlapping the search's bounding box.
+
+    :param query: geosearch keyword arguments
+    """
+    everything = list(range(ShardCount))
+
+    if ShardBy != "geohash":
+        return everything
+
+    scale = UNITS[query.get('unit', 'm').lower()] / 1000
+    lat = float(query['latitude'])
+    lon = float(query['longitude'])
+
+    if query.get('radius') is not None:
+        half_w = half_h = query['radius'] * scale
+    else:
+        half_w = query['width'] * scale / 2
+        half_h = query['height'] * scale / 2
+
+    delta_lat = math.degrees(half_h / EARTH_RADIUS_KM)
+    edge = min(abs(lat) + delta_lat, 90)
+
+    if edge >= 89.9:
+        return everything
+
+    delta_lon = math.degrees(half_w / (EARTH_RADIUS_KM * math.cos(math.radians(edge))))
+
+    if delta_lon >= 180:
+        return everything
+
+    cells = 1 << SHARD_BITS
+    lat_lo = _cell(lat - delta_lat, lon)[0]
+    lat_hi = _cell(lat + delta_lat, lon)[0]
+
+    # longitude cells aren't clamped, they wrap around the antimeridian below
+    lon_lo = math.floor((lon - delta_lon + 180) / 360 * cells)
+    lon_hi = math.floor((lon + delta_lon + 180) / 360 * cells)
+
+    found = set()
+
+    for lat_i in range(lat_lo, lat_hi + 1):
+        for lon_i in range(lon_lo, lon_hi + 1):
+            found.add(_cell_shard(lat_i, lon_i % cells))
+
+            if len(found) == ShardCount:
+                return everything
+
+    return sorted(found)
+
+
+def merge_shards(parts, sort=None, count=None, any_=False, withdist=True):
+    """
+    combine geosearch results from several shards the way one set would
+    have answered: distance ordered when asked (or when count is given
+    without any, like redis), then cut to count
+
+    :param parts: list of geosearch results, each already sorted and counted by its shard
+    """
+    if sort is None and count and not any_:
+        sort = 'ASC'
+
+    if sort is not None:
+        if not withdist:
+            raise ValueError("sorted searches across shards need withdist")
+
+        merged = heapq.merge(*parts, key=lambda ent: ent[1], reverse=sort.upper() == 'DESC')
+    else:
+        merged = itertools.chain.from_iterable(parts)
+
+    if count:
+        merged = itertools.islice(merged, count)
+
+    return list(merged)
+
+
+def load_shards(name, source, batch_size=BATCH_SIZE, fmt="auto"):
+    """
+    create a sharded geo object with one loader process per shard.  this
+    process parses source and routes each entry to its shard's queue, the
+    loaders each run async_load_data() against their own key and server.
+
+    :return: number of entries sent
+    """
+    if source == "builtin":
+        entries = Data
+    else:
+        entries = prefetch(read_entries(source, fmt))
+
+    keys = shard_keys(name)
+    block_size = batch_size * PIPELINE_DEPTH
+    blocks = [multiprocessing.Queue(maxsize=PREFETCH_DEPTH) for _ in keys]
+    workers = [
+        multiprocessing.Process(
+            target=_load_shard,
+            args=(url, key, q, batch_size, Concurrency, Verbose),
+            daemon=True,
+        )
+        for (url, key), q in zip(keys, blocks)
+    ]
+
+    for proc in workers:
+        proc.start()
+
+    pending = [[] for _ in keys]
+    added = 0
+
+    for ent in entries:
+        idx = shard_of(ent['latitude'], ent['longitude'], ent['name'])
+        pending[idx].append(ent)
+        added += 1
+
+        if len(pending[idx]) >= block_size:
+            _hand_off(blocks[idx], pending[idx], workers[idx])
+            pending[idx] = []
+
+    for idx, proc in enumerate(workers):
+        if pending[idx]:
+            _hand_off(blocks[idx], pending[idx], proc)
+        _hand_off(blocks[idx], None, proc)
+
+    for (url, key), proc in zip(keys, workers):
+        proc.join()
+
+        if proc.exitcode != 0:
+            raise RuntimeError(f"loading shard {key} on {url} failed")
+
+    Redis.incr(name + VERSION_SUFFIX)
+
+    return added
+
+
+def _hand_off(q, block, proc):
+    """put block on a loader's queue without hanging if the loader died"""
+    while True:
+        try:
+            q.put(block, timeout=1)
+            return
+        except queue.Full:
+            if not proc.is_alive():
+                raise RuntimeError("shard loader exited early")
+
+
+def _load_shard(url, key, blocks, batch_size, concurrency, verbose):
+    """loader process body for load_shards(), blocks of entries until None"""
+    global RedisUrl, Redis, Verbose, Concurrency, ShardCount
+
+    RedisUrl = url
+    Redis = redis.from_url(url)
+    Verbose = verbose
+    Concurrency = concurrency
+    ShardCount = 1      # this key is one shard, don't shard it again
+
+    def entries():
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            yield from block
+
+    asyncio.run(with_client(async_load_data, key, entries(), batch_size=batch_size, concurrency=concurrency))
+
+
+def load_data(name, entries, batch_size=BATCH_SIZE):
+    """
+    load geospatial data from a list of dicts
+
+    entries are grouped into multi-member GEOADD commands of batch_size
+    members each, and those are sent through a non-transactional pipeline
+    PIPELINE_DEPTH commands at a time, so we pay one round trip per
+    batch_size * PIPELINE_DEPTH entries instead of one per entry.
+
+    :param name: redis geo name
+    :param entries: iterable of dicts
+    :param batch_size: entries sent per GEOADD command
+    :return: number of entries sent
+    """
+    writer = _Batcher(Redis, name, batch_size)
+    added = 0
+
+    for ent in entries:
+        what = ent['name']
+        lat = ent['latitude']
+        lon = ent['longitude']
+
+        if Verbose:
+            print(f"Adding: {what} at {lat:.5f},{lon:.5f}", file=sys.stderr)
+
+        writer.add(lon, lat, what)
+        added += 1
+
+    writer.flush()
+
+    return added
+
+
+class _Batcher:
+    """
+    collects members into multi-member GEOADD and ZREM commands of
+    batch_size members and sends them over a non-transactional pipeline
+    PIPELINE_DEPTH commands at a time
+    """
+
+    def __init__(self, client, key, batch_size=BATCH_SIZE):
+        self.pipe = client.pipeline(transaction=False)
+        self.key = key
+        self.batch_size = batch_size
+        self.values = []
+        self.gone = []
+        self.queued = 0
+
+    def add(self, lon, lat, what):
+        self.values.extend((lon, lat, what))
+
+        if len(self.values) >= 3 * self.batch_size:
+            self.pipe.geoadd(self.key, self.values)
+            self.values = []
+            self._sent()
+
+    def remove(self, member):
+        self.gone.append(member)
+
+        if len(self.gone) >= self.batch_size:
+            self.pipe.zrem(self.key, *self.gone)
+            self.gone = []
+            self._sent()
+
+    def _sent(self):
+        self.queued += 1
+
+        if self.queued >= PIPELINE_DEPTH:
+            self.pipe.execute()
+            self.queued = 0
+
+    def flush(self):
+        if self.values:
+            self.pipe.geoadd(self.key, self.values)
+            self.values = []
+            self.queued += 1
+
+        if self.gone:
+            self.pipe.zrem(self.key, *self.gone)
+            self.gone = []
+            self.queued += 1
+
+        if self.queued:
+            self.pipe.execute()
+            self.queued = 0
+
+
+class LocalGeo:
+    """
+    in-process stand in for the handful of redis commands geo.py uses, so
+    searches never leave the process.
+
+    each geo set keeps its points in numpy arrays sorted by latitude; a
+    search bisects to the latitude band that can match and then filters
+    that band with vectorized distance math, using the same rules redis
+    uses for radius and box membership.
+    """
+
+    def __init__(self):
+        self.sets = {}
+        self.strings = {}
+
+    def _set(self, name):
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+        return self.sets.get(name)
+
+    def pipeline(self, transaction=True):
+        return _LocalPipeline(self)
+
+    def geoadd(self, name, values, nx=False, xx=False, ch=False):
+        if isinstance(name, bytes):
+            name = name.decode('utf-8')
+
+        s = self.sets.setdefault(name, _LocalSet())
+        return s.add(values)
+
+    def zcard(self, name):
+        s = self._set(name)
+        return len(s.members) if s else 0
+
+    def delete(self, *names):
+        rc = 0
+        for name in names:
+            if isinstance(name, bytes):
+                name = name.decode('utf-8')
+            if self.sets.pop(name, None) is not None or self.strings.pop(name, None) is not None:
+                rc += 1
+        return rc
+
+    def zscan_iter(self, name, match=None, count=None):
+        s = self._set(name)
+        if s is None:
+            return
+
+        for member, (lat, lon) in list(s.members.items()):
+            yield member, float(geohash_score(lat, lon))
+
+    def zrem(self, name, *members):
+        s = self._set(name)
+        return s.remove(members) if s else 0
+
+    def get(self, name):
+        return self.strings.get(name)
+
+    def incr(self, name, amount=1):
+        value = int(self.strings.get(name, b"0")) + amount
+        self.strings[name] = str(value).encode('utf-8')
+        return value
+
+    def geosearch(self, name, member=None, longitude=None, latitude=None, unit='m',
+                  radius=None, width=None, height=None, sort=None, count=None, any=False,
+                  withcoord=False, withdist=False, withhash=False):
+        if member is not None or withhash:
+            raise NotImplementedError("local backend only searches from longitude/latitude")
+
+        if any and not count:
+            raise redis.DataError("GEOSEARCH ``any`` can't be provided without ``count``")
+
+        s = self._set(name)
+        if s is None:
+            return []
+
+        scale = UNITS[unit.lower()]
+        lat_0 = float(latitude)
+        lon_0 = float(longitude)
+
+        if radius is not None:
+            reach = radius * scale
+        else:
+            reach = height * scale / 2
+
+        lats, lons, names = s.band(lat_0, math.degrees(reach / (EARTH_RADIUS_KM * 1000)))
+        dist = distances((lat_0, lon_0), np.column_stack((lats, lons))) * 1000
+
+        if radius is not None:
+            hit = dist <= reach
+        else:
+            # the band already holds the height, east-west distance is
+            # measured along each point's own parallel
+            hit = distances_along(lats, lons, lon_0) * 1000 <= width * scale / 2
+
+        idx = np.flatnonzero(hit)
+        dist = dist[idx]
+
+        if sort is None and count and not any:
+            sort = 'ASC'
+
+        if any and count:
+            idx = idx[:count]
+            dist = dist[:count]
+
+        if sort is not None:
+            order = np.argsort(dist, kind='stable')
+            if sort.upper() == 'DESC':
+                order = order[::-1]
+            idx = idx[order]
+            dist = dist[order]
+
+        if count and not any:
+            idx = idx[:count]
+            dist = dist[:count]
+
+        dist = np.round(dist / scale, 4).tolist()
+        results = []
+
+        for i, d in zip(idx.tolist(), dist):
+            if not withdist and not withcoord:
+                results.append(names[i])
+                continue
+
+            ent = [names[i]]
+            if withdist:
+                ent.append(d)
+            if withcoord:
+                ent.append((float(lons[i]), float(lats[i])))
+            results.append(ent)
+
+        return results
+
+
+def distances_along(lats, lons, lon_0):
+    """
+    haversine distances (km) from longitude lon_0 to each point, measured
+    along each point's own parallel.  this is how redis decides whether a
+    point is inside the width of a search box.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    v = np.sin((np.radians(np.asarray(lons, dtype=np.float64)) - math.radians(lon_0)) / 2)
+    a = np.cos(lats) ** 2 * v * v
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _geohash_cells(lat, lon):
+    """latitude and longitude cell numbers of a point at GEO_STEP bits, as redis encodes them"""
+    if not (-GEO_LAT_LIMIT <= lat <= GEO_LAT_LIMIT and -180 <= lon <= 180):
+        raise redis.ResponseError(f"invalid longitude,latitude pair {lon:.6f},{lat:.6f}")
+
+    cells = 1 << GEO_STEP
+    lat_cell = min(int((lat + GEO_LAT_LIMIT) / (2 * GEO_LAT_LIMIT) * cells), cells - 1)
+    lon_cell = min(int((lon + 180) / 360 * cells), cells - 1)
+
+    return lat_cell, lon_cell
+
+
+def _spread(v):
+    """spreads the low 32 bits of v out to the even bits of a 64 bit value"""
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def geohash_score(lat, lon):
+    """the sorted set score redis gives a member at lat, lon"""
+    lat_cell, lon_cell = _geohash_cells(lat, lon)
+    return _spread(lat_cell) | (_spread(lon_cell) << 1)
+
+
+def _quantize(lat, lon):
+    """
+    snaps a point to the center of its 52 bit geohash cell, which is where
+    redis reports it from then on, so local distances agree with redis
+    """
+    lat_cell, lon_cell = _geohash_cells(lat, lon)
+    cells = 1 << GEO_STEP
+
+    return (
+        -GEO_LAT_LIMIT + (lat_cell + 0.5) * (2 * GEO_LAT_LIMIT) / cells,
+        -180 + (lon_cell + 0.5) * 360 / cells,
+    )
+
+
+class _LocalSet:
+    """one geo set for LocalGeo, members are kept as bytes like redis returns them"""
+
+    def __init__(self):
+        self.members = {}
+        self.dirty = False
+        self.lats = np.empty(0)
+        self.lons = np.empty(0)
+        self.names = []
+
+    def add(self, values):
+        added = 0
+
+        for i in range(0, len(values), 3):
+            lon, lat, what = values[i:i + 3]
+
+            if isinstance(what, str):
+                what = what.encode('utf-8')
+
+            if what not in self.members:
+                added += 1
+
+            self.members[what] = _quantize(float(lat), float(lon))
+
+        self.dirty = True
+        return added
+
+    def remove(self, members):
+        removed = 0
+
+        for what in members:
+            if isinstance(what, str):
+                what = what.encode('utf-8')
+
+            if self.members.pop(what, None) is not None:
+                removed += 1
+
+        self.dirty = True
+        return removed
+
+    def band(self, lat, delta):
+        """returns latitude, longitude, and names of members within delta degrees of latitude"""
+        if self.dirty:
+            ordered = sorted(self.members.items(), key=lambda kv: kv[1][0])
+            self.names = [kv[0] for kv in ordered]
+            coords = np.array([kv[1] for kv in ordered], dtype=np.float64).reshape(-1, 2)
+            self.lats = coords[:, 0].copy()
+            self.lons = coords[:, 1].copy()
+            self.dirty = False
+
+        lo = np.searchsorted(self.lats, lat - delta, side='left')
+        hi = np.searchsorted(self.lats, lat + delta, side='right')
+
+        return self.lats[lo:hi], self.lons[lo:hi], self.names[lo:hi]
+
+
+class _LocalPipeline:
+    """queues LocalGeo calls and runs them on execute(), like a redis pipeline"""
+
+    def __init__(self, db):
+        self.db = db
+        self.stack = []
+
+    def __getattr__(self, attr):
+        method = getattr(self.db, attr)
+
+        def queue_call(*args, **kwargs):
+            self.stack.append((method, args, kwargs))
+            return self
+
+        return queue_call
+
+    def execute(self):
+        stack, self.stack = self.stack, []
+        return [method(*args, **kwargs) for method, args, kwargs in stack]
+
+
+class _AsyncLocal:
+    """awaitable face of a LocalGeo, so the asyncio code paths run on the local backend"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def pipeline(self, transaction=True):
+        return _AsyncLocalPipeline(self.db)
+
+    def __getattr__(self, attr):
+        method = getattr(self.db, attr)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+    async def aclose(self):
+        pass
+
+
+class _AsyncLocalPipeline(_LocalPipeline):
+    async def execute(self):
+        return super().execute()
+
+
+class _ShardedAsync:
+    """
+    asyncio client facade over several shards.  geo sets are split into
+    shard_keys(); geoadd routes members with shard_of(), geosearch asks
+    only shards_for() the query and merges with merge_shards().  plain
+    string keys, like the version counters, live on the RedisUrl client.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+
+    def pipeline(self, transaction=True):
+        return _ShardedPipeline(self)
+
+    async def get(self, name):
+        return await self.clients[RedisUrl].get(name)
+
+    async def incr(self, name, amount=1):
+        return await self.clients[RedisUrl].incr(name, amount)
+
+    async def zcard(self, name):
+        counts = await asyncio.gather(*(self.clients[url].zcard(key) for url, key in shard_keys(name)))
+        return sum(counts)
+
+    async def delete(self, *names):
+        deleted = 0
+
+        for name in names:
+            counts = await asyncio.gather(*(self.clients[url].delete(key) for url, key in shard_keys(name)))
+            deleted += sum(counts)
+
+        return deleted
+
+    async def geoadd(self, name, values, **kwargs):
+        return (await self.pipeline().geoadd(name, values, **kwargs).execute())[0]
+
+    async def geosearch(self, name, **kwargs):
+        return (await self.pipeline().geosearch(name, **kwargs).execute())[0]
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
+
+
+class _ShardedPipeline:
+    """
+    pipeline for _ShardedAsync, one real pipeline per server, executed
+    concurrently; each queued command remembers which replies to combine
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.pipes = {}
+        self.commands = []
+
+    def _queue(self, url, method, *args, **kwargs):
+        if url not in self.pipes:
+            self.pipes[url] = [self.db.clients[url].pipeline(transaction=False), 0]
+
+        slot = self.pipes[url]
+        getattr(slot[0], method)(*args, **kwargs)
+        slot[1] += 1
+
+        return url, slot[1] - 1
+
+    def geoadd(self, name, values, **kwargs):
+        keys = shard_keys(name)
+        routed = {}
+
+        for i in range(0, len(values), 3):
+            lon, lat, what = values[i:i + 3]
+            routed.setdefault(shard_of(lat, lon, what), []).extend((lon, lat, what))
+
+        replies = [self._queue(keys[idx][0], 'geoadd', keys[idx][1], part, **kwargs) for idx, part in routed.items()]
+        self.commands.append((sum, replies))
+        return self
+
+    def geosearch(self, name, **kwargs):
+        keys = shard_keys(name)
+        sort, count, any_ = kwargs.get('sort'), kwargs.get('count'), kwargs.get('any', False)
+
+        # merging by distance needs distances even when the caller doesn't want them
+        strip = not kwargs.get('withdist', False) and (sort is not None or (count and not any_))
+        shard_kwargs = dict(kwargs, withdist=True) if strip else kwargs
+        replies = [
+            self._queue(keys[idx][0], 'geosearch', keys[idx][1], **shard_kwargs)
+            for idx in shards_for(kwargs)
+        ]
+
+        def combine(parts):
+            merged = merge_shards(parts, sort, count, any_, shard_kwargs.get('withdist', False))
+
+            if strip:
+                if kwargs.get('withcoord', False):
+                    merged = [[ent[0]] + ent[2:] for ent in merged]
+                else:
+                    merged = [ent[0] for ent in merged]
+
+            return merged
+
+        self.commands.append((combine, replies))
+        return self
+
+    async def execute(self):
+        pipes, self.pipes = self.pipes, {}
+        commands, self.commands = self.commands, []
+
+        urls = list(pipes)
+        answers = await asyncio.gather(*(pipes[url][0].execute() for url in urls))
+        answers = dict(zip(urls, answers))
 
-        Redis.geoadd(name, (lon, lat, what))
+        return [combine([answers[url][pos] for url, pos in replies]) for combine, replies in commands]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+    Throughput benchmarks for geo.py
+
+    Usage:
+
+        python3 ./geo_bench.py
+            [--backend redis|fakeredis|local]   -- what to run against, default redis
+            [--redis url]                       -- url for redis, default redis://localhost
+            [--points n]                        -- synthetic points to load, default 100000
+            [--distribution uniform|clustered]  -- uniform over the globe, or clustered around geo.Data
+            [--per-point n]                     -- points loaded one GEOADD at a time, default 10000
+            [--batch-size n]                    -- entries per GEOADD for pipelined loads, default 1000
+            [--queries n]                       -- searches timed per case, default 200
+            [--counts list]                     -- comma separated --count values to search with, default 10,100,1000
+            [--seed n]                          -- random seed, default 1
+            [--output file]                     -- write results as json here, default stdout
+
+    Searches go through geo.py's own async_search() and SearchCache, with a
+    radius scaled to the point density so --count limits the results, and
+    geo.write_results() is timed in each --output-format.
+
+    Each run writes a json document with the settings and one record per
+    case, so runs can be diffed for regressions.  The benchmark uses keys
+    named geo_bench:* and deletes them afterwards.
+
+    Requires:
+
+        pip install redis[hiredis] numpy
+        pip install fakeredis       -- only for --backend fakeredis
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+import redis
+
+import geo
+
+KEY = "geo_bench"
+MAX_RADIUS = 20040.0    # km, half way around the world, a search this wide finds everything
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", type=str, default="redis", choices=["redis", "fakeredis", "local"])
+    ap.add_argument("--redis", type=str, default=geo.RedisUrl)
+    ap.add_argument("--points", type=int, default=100_000)
+    ap.add_argument("--distribution", type=str, default="uniform", choices=["uniform", "clustered"])
+    ap.add_argument("--per-point", type=int, default=10_000)
+    ap.add_argument("--batch-size", type=int, default=geo.BATCH_SIZE)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--counts", type=str, default="10,100,1000")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", type=str, default=None)
+    args = ap.parse_args()
+
+    connect(args.backend, args.redis)
+
+    rng = random.Random(args.seed)
+    points = make_points(args.points, args.distribution, rng)
+    counts = [int(c) for c in args.counts.split(",") if c]
+    results = []
+
+    try:
+        results += bench_create(points, args.per_point, args.batch_size)
+        results += bench_search(points, args.queries, counts, rng)
+        results += bench_output(points, rng)
+        results += bench_bearing(points)
+    finally:
+        for key in [KEY + ":per-point", KEY + ":pipelined", KEY + ":async", KEY + geo.VERSION_SUFFIX]:
+            geo.Redis.delete(key)
+
+    report = {
+        "settings": vars(args),
+        "python": platform.python_version(),
+        "when": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def connect(backend, url):
+    """points geo.py at the backend we are timing"""
+    if backend == "local":
+        geo.Redis = geo.LocalGeo()
+    elif backend == "fakeredis":
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        geo.Redis = fakeredis.FakeRedis(server=server)
+        geo.async_client = lambda url=None: fakeredis.FakeAsyncRedis(server=server)
+    else:
+        geo.RedisUrl = url
+        geo.RedisUrls = [url]
+        geo.Redis = redis.from_url(url)
+
+
+def make_points(n, distribution, rng):
+    """
+    synthetic entries for load_data().  "uniform" spreads them over the
+    latitudes redis accepts, "clustered" scatters them within a few km of
+    the huts and shelters in geo.Data
+    """
+    points = []
+
+    for i in range(n):
+        if distribution == "clustered":
+            center = rng.choice(geo.Data)
+            lat = center['latitude'] + rng.gauss(0, 0.02)
+            lon = center['longitude'] + rng.gauss(0, 0.03)
+        else:
+            lat = rng.uniform(-geo.GEO_LAT_LIMIT, geo.GEO_LAT_LIMIT)
+            lon = rng.uniform(-180, 180)
+
+        points.append({"name": f"p{i}", "latitude": lat, "longitude": lon})
+
+    return points
+
+
+def record(case, n, seconds, **extra):
+    rc = {
+        "case": case,
+        "n": n,
+        "seconds": round(seconds, 6),
+        "per_sec": round(n / seconds, 1) if seconds > 0 else None,
+    }
+    rc.update(extra)
+    return rc
+
+
+def bench_create(points, per_point, batch_size):
+    """time loading one GEOADD per point against pipelined and asyncio loads"""
+    results = []
+    sample = points[:per_point]
+
+    start = time.perf_counter()
+    for ent in sample:
+        geo.Redis.geoadd(KEY + ":per-point", (ent['longitude'], ent['latitude'], ent['name']))
+    results.append(record("create/per-point", len(sample), time.perf_counter() - start))
+
+    start = time.perf_counter()
+    geo.load_data(KEY + ":pipelined", points, batch_size=batch_size)
+    results.append(record("create/pipelined", len(points), time.perf_counter() - start, batch_size=batch_size))
+
+    start = time.perf_counter()
+    asyncio.run(geo.with_client(geo.async_load_data, KEY + ":async", points, batch_size=batch_size))
+    results.append(record(
+        "create/async", len(points), time.perf_counter() - start,
+        batch_size=batch_size, concurrency=geo.Concurrency,
+    ))
+
+    return results
+
+
+def calibrate(name, points, counts, rng, probes=20):
+    """
+    radius in km for searches from random members that finds about twice
+    the largest count when uncapped, so every count really limits the
+    results.  starts at 50 km and rescales by area from what a few probe
+    searches find, so it fits any --points and --distribution
+    """
+    want = max(1, min(2 * max(counts), len(points) // 2))
+    origins = [rng.choice(points) for _ in range(probes)]
+    radius = 50.0
+
+    for _ in range(10):
+        found = sum(len(geo.Redis.geosearch(name, latitude=ent['latitude'], longitude=ent['longitude'],
+                                            radius=radius, unit='km'))
+                    for ent in origins) / probes
+
+        if found == 0:
+            radius = min(radius * 4, MAX_RADIUS)
+            continue
+
+        ratio = want / found
+        if 0.8 < ratio < 1.25 or radius >= MAX_RADIUS:
+            break
+
+        radius = min(radius * math.sqrt(ratio), MAX_RADIUS)
+
+    return radius
+
+
+async def run_searches(client, name, queries, warm=False):
+    """
+    each query through geo.async_search(), one after another, returns
+    (results found, seconds).  warm runs them all once untimed first, so
+    the timed pass is served by the SearchCache
+    """
+    if warm:
+        for query in queries:
+            await geo.async_search(client, name, query, 'ASC')
+
+    found = 0
+    start = time.perf_counter()
+
+    for query in queries:
+        found += len(await geo.async_search(client, name, query, 'ASC'))
+
+    return found, time.perf_counter() - start
+
+
+def bench_search(points, queries, counts, rng):
+    """
+    time radius and box searches from random members at each count, through
+    geo.py's own search path: async_search() with the SearchCache turned
+    off, and again with every search a cache hit.  the radius is scaled to
+    the point density, see calibrate(), and the box has the same area
+    """
+    name = KEY + ":pipelined"
+    radius = calibrate(name, points, counts, rng)
+    side = radius * math.sqrt(math.pi)
+    origins = [rng.choice(points) for _ in range(queries)]
+    results = []
+    cases = [
+        ("search/radius", dict(radius=radius)),
+        ("search/box", dict(width=side, height=side)),
+    ]
+    cache = geo.Cache
+
+    try:
+        for case, shape in cases:
+            for count in counts:
+                batch = [dict(latitude=ent['latitude'], longitude=ent['longitude'], count=count, **shape)
+                         for ent in origins]
+
+                for cached in [False, True]:
+                    geo.Cache = geo.SearchCache(size=len(batch) if cached else 0)
+
+                    try:
+                        found, seconds = asyncio.run(geo.with_client(run_searches, name, batch, warm=cached))
+                    except redis.ResponseError as e:
+                        results.append({"case": case, "count": count, "error": str(e)})
+                        break
+
+                    results.append(record(
+                        case + ("/cached" if cached else ""), len(batch), seconds,
+                        count=count, mean_results=round(found / max(len(batch), 1), 1),
+                        **{k + "_km": round(v, 3) for k, v in shape.items()},
+                    ))
+    finally:
+        geo.Cache = cache
+
+    return results
+
+
+def bench_output(points, rng):
+    """
+    time geo.write_results() in each --output-format on one search that
+    finds every point, written to os.devnull
+    """
+    name = KEY + ":pipelined"
+    origin = rng.choice(points)
+    query = dict(latitude=origin['latitude'], longitude=origin['longitude'], radius=MAX_RADIUS)
+    results = []
+    cache = geo.Cache
+    geo.Cache = geo.SearchCache(size=0)
+
+    try:
+        for fmt in geo.OUTPUT_FORMATS:
+            raw = fmt == "members"
+            found = asyncio.run(geo.with_client(geo.async_search, name, query, 'ASC', raw=raw))
+            args = argparse.Namespace(output_format=fmt, output=os.devnull, bearing=not raw,
+                                      latitude=origin['latitude'], longitude=origin['longitude'])
+
+            start = time.perf_counter()
+            geo.write_results(found, args)
+            results.append(record("output/" + fmt, len(found), time.perf_counter() - start, bearing=not raw))
+    finally:
+        geo.Cache = cache
+
+    return results
+
+
+def bench_bearing(points):
+    """time scalar bearing() against vectorized bearings() from one origin"""
+    origin = (geo.Data[0]['latitude'], geo.Data[0]['longitude'])
+    coords = [(ent['latitude'], ent['longitude']) for ent in points]
+
+    start = time.perf_counter()
+    for p in coords:
+        geo.bearing(origin, p)
+    scalar = record("bearing/scalar", len(coords), time.perf_counter() - start)
+
+    array = np.array(coords, dtype=np.float64)
+    start = time.perf_counter()
+    geo.bearings(origin, array)
+    vector = record("bearing/vectorized", len(coords), time.perf_counter() - start)
+
+    return [scalar, vector]
+
+
+if __name__ == '__main__':
+    main()
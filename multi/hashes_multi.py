@@ -1,31 +1,189 @@
 #!/usr/bin/env python3
 """
-    computes sha512 hashes of files in parallel after building the list of files
+    computes sha512 hashes of files in parallel after building the list of files,
+    or with --algorithms any set of hashlib digests from a single read of each file.
+    every mode but --dedup prints a "digests  filename" line per file on stdout,
+    and everything else on stderr
+
+    --executor picks sequential, threads, or processes (--workers of them);
+    the default, auto, picks one from a sample of file sizes and says why
+
+    files of 64 MB or more are hashed through mmap; use --no-mmap on trees
+    that change while they're hashed, a truncated mapped file is a SIGBUS
+
+    --stats text|json reports walk, queue, read, and hash times per phase and
+    per worker, and the slowest files, on stderr at the end
+
+    with --stream the directory walk feeds the pool as it goes, and each
+    "hash  filename" line is printed as soon as it is ready
+
+    with --schedule files are stat'ed first and sent largest first, small
+    ones batched by total bytes and count, and optionally very large ones split into
+    ranges that are tree hashed in parallel (see misc.tree_label())
+
+    with --dedup only same size files are read, first just their ends, and
+    groups of identical files are printed as they are confirmed
 """
 
+import sys
 import time
-from multiprocessing import Pool, cpu_count
+from functools import partial
 
 import misc
 
 
-def worker(fn):
+def worker(fn, algorithms=None):
     """returns both our filename and the result to play nicely with imap_unordered()"""
-    return fn, misc.hash_file(fn)
+    return fn, misc.hash_file(fn, algorithms)
+
+
+def pick_worker(args):
+    """our worker, or the caching one if --cache was given, hashing with --algorithms"""
+    if args.cache:
+        return partial(misc.cached_worker, args.cache, algorithms=args.algorithms)
+
+    return partial(worker, algorithms=args.algorithms)
+
+
+def stream(args, stats):
+    """hash while walking, at most args.depth files in flight, results as they finish"""
+    print(f"Streaming file hashes for {args.root} with {args.executor=} {args.workers=} {args.depth=}", file=sys.stderr)
 
+    start = time.perf_counter()
+    first = None
+    count = 0
+    hits = 0
+
+    with stats.phase("hash"), misc.make_pool(args.executor, args.workers) as pool:
+        for r in stats.imap_bounded(pool, pick_worker(args), stats.iterate("walk", misc.walk(args), "hash"),
+                                    args.depth):
+            if first is None:
+                first = time.perf_counter() - start
+
+            print(f"{misc.format_digests(r[1])}  {r[0]}")
+            count += 1
+
+            if args.cache:
+                hits += r[2]
+
+    elapsed = time.perf_counter() - start
+    first = elapsed if first is None else first
+    print(f"streamed hashes of {count} files:  {elapsed:.3f} seconds, first after {first:.3f} seconds", file=sys.stderr)
+
+    if args.cache:
+        # no list of the files we streamed, evict() checks whether each cached path still exists
+        misc.close_cache(args.cache, args.root, [], hits, file=sys.stderr, total=count)
 
-def main():
-    args = misc.parse_args()
-    print(f"Computing file hashes for {args.root} with {cpu_count()=}")
+
+def scheduled(args, stats):
+    """size-aware hashing, see misc.schedule()"""
+    print(f"Scheduling file hashes for {args.root} with {args.executor=} {args.workers=}", file=sys.stderr)
 
     start = time.perf_counter()
-    files = [f for f in misc.all_files(args.root)]
-    with Pool() as pool:
-        results = [r for r in pool.imap_unordered(worker, files)]
-        files = [r[0] for r in results]
-        hashes = [r[1] for r in results]
+    with stats.phase("stat"):
+        sized = misc.sized_files(stats.iterate("walk", misc.walk(args)))
+    work = list(misc.schedule(sized, args.chunk_bytes, args.split_size, args.range_size, args.chunk_files,
+                              args.workers))
+
+    with stats.phase("hash"), misc.make_pool(args.executor, args.workers) as pool:
+        hashed = stats.imap(pool, partial(misc.hash_work, algorithms=args.algorithms, cache_path=args.cache), work)
+        count = trees = hits = 0
+
+        for r in misc.collect_ranges(hashed, args.range_size, args.algorithms):
+            line = misc.format_digests(r[1])
+            print(f"{line}  {r[0]}")
+            count += 1
+            trees += "tree-" in line
+            hits += r[2] if args.cache else 0
+
+    print(f"scheduled hashes of {count} files in {len(work)} work items, {trees} tree hashed:  "
+          f"{time.perf_counter()-start:.3f} seconds", file=sys.stderr)
+
+    if args.cache:
+        # split files are tree hashed and never cached, they count as misses
+        misc.close_cache(args.cache, args.root, [path for path, size in sized], hits, file=sys.stderr, total=count)
+
+
+def dedup(args, stats):
+    """prints groups of duplicate files, see misc.find_duplicates()"""
+    print(f"Finding duplicate files in {args.root} with {args.executor=} {args.workers=} {args.edge_size=}", file=sys.stderr)
+
+    if args.algorithms:
+        print(f"[warning] --algorithms is not used with --dedup", file=sys.stderr)
+
+    start = time.perf_counter()
+    with stats.phase("stat"):
+        sized = misc.sized_files(stats.iterate("walk", misc.walk(args)))
+    total = sum(size for path, size in sized)
+    counts = {}
+    groups = 0
+    duplicates = 0
+    wasted = 0
+
+    with stats.phase("hash"), misc.make_pool(args.executor, args.workers) as pool:
+        for size, digest, paths in misc.find_duplicates(pool, sized, args.edge_size, args.min_size, counts, stats,
+                                                          args.cache):
+            for path in paths:
+                print(f"{digest}  {path}")
+            print(flush=True)
+
+            groups += 1
+            duplicates += len(paths) - 1
+            wasted += size * (len(paths) - 1)
+
+    read = counts["edge_bytes"] + counts["full_bytes"]
+    print(f"found {groups} groups, {duplicates} duplicate files, {wasted} bytes wasted in {len(sized)} files:  "
+          f"{time.perf_counter()-start:.3f} seconds", file=sys.stderr)
+    print(f"read {read} of {total} bytes ({read / total if total else 0.0:.2%}), "
+          f"{counts['edge_files']} edge hashed, {counts['full_files']} fully hashed", file=sys.stderr)
+
+    if args.cache:
+        # only full hashes go through the cache, edge hashes are cheap
+        misc.close_cache(args.cache, args.root, [path for path, size in sized], counts["full_hits"],
+                         file=sys.stderr, total=counts["full_files"])
+
+
+def hash_all(args, stats):
+    """hashes every file after walking the whole tree"""
+    print(f"Computing file hashes for {args.root} with {args.executor=} {args.workers=}", file=sys.stderr)
+
+    start = time.perf_counter()
+    files = [f for f in stats.iterate("walk", misc.walk(args))]
+    with stats.phase("hash"), misc.make_pool(args.executor, args.workers) as pool:
+        results = [r for r in stats.imap(pool, pick_worker(args), files)]
+
+    for r in results:
+        print(f"{misc.format_digests(r[1])}  {r[0]}")
+
+    print(f"{args.executor} hashes of {len(results)} files:  {time.perf_counter()-start:.3f} seconds", file=sys.stderr)
+
+    if args.cache:
+        misc.close_cache(args.cache, args.root, files, sum(r[2] for r in results), file=sys.stderr)
+
+
+def main(**defaults):
+    args = misc.parse_args(**defaults)
+    if args.no_mmap:
+        misc.MMAP_SIZE = 0
+    stats = misc.Stats(enabled=args.stats is not None, slowest=args.slowest)
+
+    with stats.phase("calibrate"):
+        args.executor, args.workers, reason = misc.choose_executor(args)
+    print(f"[info] hashing with {args.executor}, {args.workers} workers: {reason}", file=sys.stderr)
+
+    if args.stream:
+        mode = stream
+    elif args.schedule:
+        mode = scheduled
+    elif args.dedup:
+        mode = dedup
+    else:
+        mode = hash_all
+
+    mode(args, stats)
 
-    print(f"parallel hashes of {len(hashes)} files:  {time.perf_counter()-start:.3f} seconds")
+    if args.stats:
+        misc.print_stats(stats, args.stats, mode=mode.__name__, executor=args.executor, workers=args.workers)
 
 
 if __name__ == '__main__':
@@ -4,17 +4,60 @@
 """
 
 from pathlib import Path
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from functools import partial
 import argparse
+import fnmatch
 import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
 
 Hasher = hashlib.sha512
-BLOCK_SIZE = 4096 * 4096
+BLOCK_SIZE = 4096 * 4096            # largest read, and the most buffer a worker ever holds
+MIN_BLOCK = 64 * 1024               # smallest read buffer
+MMAP_SIZE = 64 * 1024 * 1024        # files at least this big are hashed through mmap, 0 never maps
+NETWORK_FS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre", "fuse.sshfs"}
+PENDING_PER_WORKER = 8      # default files in flight per worker when streaming
+CHUNK_BYTES = 64 * 1024 * 1024      # small files are batched until a batch holds this much
+CHUNK_FILES = 1000          # or this many files
+ITEMS_PER_WORKER = 4        # batches per worker schedule() aims for at least, on small trees
+RANGE_SIZE = 256 * 1024 * 1024      # range length when splitting very large files
+CACHE_TIMEOUT = 60.0        # seconds to wait for another process holding the cache's write lock
+FOLLOW_LINKS = ["never", "files", "all"]
+EXECUTORS = ["sequential", "threads", "processes", "auto"]
+CALIBRATE_FILES = 256       # files stat'ed by --executor auto
+THREAD_MIN_BYTES = 1024 * 1024      # mean file size where threads hash as fast as processes
+SLOWEST = 10                # work items listed by --stats
+EDGE_SIZE = 4096            # bytes read from each end of a file when looking for duplicates
 
 
-def all_files(root):
+def all_files(root, include=None, exclude=None, follow_links="files", one_filesystem=False, threads=0):
     """
         generates sequence all files below root in the directory tree
         raises ValueError if root does not exist or is not a directory
+
+        the walk uses os.scandir() and the type information cached in each
+        DirEntry, so directories cost no extra stat and only files become
+        Path objects.
+
+        :param include: glob patterns, only files whose name or path relative to root matches one are kept
+        :param exclude: glob patterns, matching files are dropped and matching directories not entered
+        :param follow_links: "never" skips symlinks, "files" keeps links to files but doesn't
+                             enter linked directories, "all" enters them too (each directory once)
+        :param one_filesystem: don't descend into directories on a different device than root
+        :param threads: scan this many directories at once on threads, for slow (network) filesystems
     """
 
     root = Path(root)
@@ -27,30 +70,1045 @@ def all_files(root):
         print(f"{root} must be a directory")
         raise ValueError
 
-    for ent in root.glob("**/*"):
-        if ent.is_file():
-            yield ent
+    walker = _Walker(str(root), include, exclude, follow_links, one_filesystem)
+
+    if threads > 1:
+        yield from walker.parallel(threads)
+    else:
+        yield from walker.serial()
+
+
+def _patterns(patterns):
+    """one compiled regex matching any of the glob patterns, or None"""
+    if not patterns:
+        return None
+
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+class _Walker:
+    """
+        state for one all_files() walk, see scan()
+    """
+
+    def __init__(self, root, include, exclude, follow_links, one_filesystem):
+        if follow_links not in FOLLOW_LINKS:
+            raise ValueError(f"follow_links must be one of {FOLLOW_LINKS}")
+
+        st = os.stat(root)
+        self.root = root
+        self.prefix = len(os.path.join(root, ""))
+        self.include = _patterns(include)
+        self.exclude = _patterns(exclude)
+        self.follow_links = follow_links
+        self.device = st.st_dev if one_filesystem else None
+        self.visited = {(st.st_dev, st.st_ino)}
+        self.lock = threading.Lock()
+
+    def matches(self, pattern, ent):
+        rel = ent.path[self.prefix:]
+        if os.sep != "/":
+            rel = rel.replace(os.sep, "/")
+
+        return pattern.match(ent.name) is not None or pattern.match(rel) is not None
+
+    def first_visit(self, st):
+        """True the first time we see the directory st, guards against symlink loops"""
+        with self.lock:
+            if (st.st_dev, st.st_ino) in self.visited:
+                return False
+            self.visited.add((st.st_dev, st.st_ino))
+            return True
+
+    def scan(self, directory):
+        """
+            lists one directory, returns ([file paths], [subdirectory paths]).
+            directories we can't read are skipped like Path.glob() does.
+        """
+        files = []
+        subdirs = []
+        follow_dirs = self.follow_links == "all"
+
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            return files, subdirs
+
+        with it:
+            for ent in it:
+                try:
+                    if self.follow_links == "never" and ent.is_symlink():
+                        continue
+
+                    if ent.is_dir(follow_symlinks=follow_dirs):
+                        if self.exclude and self.matches(self.exclude, ent):
+                            continue
+                        if self.device is not None or follow_dirs:
+                            st = ent.stat(follow_symlinks=follow_dirs)
+                            if self.device is not None and st.st_dev != self.device:
+                                continue
+                            if follow_dirs and not self.first_visit(st):
+                                continue
+                        subdirs.append(ent.path)
+
+                    elif ent.is_file():
+                        if self.exclude and self.matches(self.exclude, ent):
+                            continue
+                        if self.include and not self.matches(self.include, ent):
+                            continue
+                        files.append(ent.path)
+
+                except OSError:
+                    continue
+
+        return files, subdirs
+
+    def serial(self):
+        stack = [self.root]
+
+        while stack:
+            files, subdirs = self.scan(stack.pop())
+            for fn in files:
+                yield Path(fn)
+            stack.extend(reversed(subdirs))
+
+    def parallel(self, threads):
+        """
+            scans directories on a thread pool, each finished directory
+            submits its subdirectories, files are generated as they're found
+        """
+        pool = ThreadPoolExecutor(threads)
+
+        try:
+            pending = {pool.submit(self.scan, self.root)}
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    files, subdirs = future.result()
+                    for directory in subdirs:
+                        pending.add(pool.submit(self.scan, directory))
+                    for fn in files:
+                        yield Path(fn)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def walk(args):
+    """all_files() for args.root with the walk options from parse_args()"""
+    return all_files(args.root, args.include, args.exclude, args.follow_links, args.one_filesystem, args.walk_threads)
+
+
+_local = threading.local()  # per thread read buffer and HashCache, see read_buffer() and cached_hash()
+
+
+def read_buffer(size):
+    """
+        memoryview of this thread's reusable read buffer, at least size bytes
+    """
+    buffer = getattr(_local, "buffer", None)
+
+    if buffer is None or len(buffer) < size:
+        buffer = _local.buffer = bytearray(size)
+
+    return memoryview(buffer)[:size]
+
+
+def block_size(size):
+    """
+        read size for a file of size bytes: the next power of two that holds
+        the whole file, between MIN_BLOCK and BLOCK_SIZE
+    """
+    return min(BLOCK_SIZE, max(MIN_BLOCK, 1 << max(size - 1, 0).bit_length()))
 
 
-def hash_file(file):
+def parse_algorithms(text):
+    """
+        parses a comma separated list of hashlib algorithm names like
+        "sha256,md5,blake2b" into their canonical names
+    """
+    names = []
+
+    for name in str(text).split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in hashlib.algorithms_available or name.startswith("shake_"):
+            raise argparse.ArgumentTypeError(
+                f"unsupported algorithm {name!r}, choose from "
+                f"{', '.join(sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith('shake_')))}")
+        name = hashlib.new(name).name
+        if name not in names:
+            names.append(name)
+
+    if not names:
+        raise argparse.ArgumentTypeError("no algorithms given")
+
+    return names
+
+
+def hashers(algorithms=None):
+    """
+        fresh hash objects, one per name in algorithms, or just Hasher() if None
+    """
+    if not algorithms:
+        return [Hasher()]
+
+    return [hashlib.new(name) for name in algorithms]
+
+
+def format_digests(digests):
+    """
+        one line's worth of hash_file() output: a plain hexdigest as is,
+        several as "name:hexdigest" separated by spaces
+    """
+    if isinstance(digests, str):
+        return digests
+
+    return " ".join(f"{name}:{digest}" for name, digest in digests.items())
+
+
+def _feed(f, hs, buf, length=None):
+    """
+        reads f into buf and updates every hasher in hs with it, until end
+        of file or length bytes.  when this thread is running under timed()
+        the time spent reading and hashing is added up for --stats.
+    """
+    timing = getattr(_local, "timing", None)
+
+    while length is None or length > 0:
+        t0 = time.perf_counter()
+        n = f.readinto(buf if length is None else buf[:min(len(buf), length)])
+        if not n:
+            break
+
+        t1 = time.perf_counter()
+        for h in hs:
+            h.update(buf[:n])
+
+        if timing is not None:
+            timing[0] += t1 - t0
+            timing[1] += time.perf_counter() - t1
+            timing[2] += n
+
+        if length is not None:
+            length -= n
+
+
+def hash_file(file, algorithms=None):
     """
         computes hash of file.  usually with sha512
+
+        with a list of algorithms every one of them is fed from the same
+        read, so the file is only read once, and a dict of
+        {algorithm: hexdigest} is returned instead of a single hexdigest.
+
+        big files on local filesystems are mapped and handed to the hashers
+        whole; everything else is read with readinto() into one reused buffer
+        sized to the file, so there is no new bytes object per read and tiny
+        files don't need a BLOCK_SIZE buffer.
+
+        beware: a mapped file that is truncated while it is being hashed
+        (a log rotated under us) kills the process with SIGBUS, where a read
+        would just come up short.  a process Pool then never gets that
+        result back and hangs.  set MMAP_SIZE to 0 (--no-mmap) for trees
+        that change while they are hashed.
+    """
+    hs = hashers(algorithms)
+
+    with open(str(file), 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+
+        # with mmap the reads are page faults inside update(), which --stats
+        # couldn't tell from hashing, so under timed() big files are read too
+        if (MMAP_SIZE and size >= MMAP_SIZE and getattr(_local, "timing", None) is None
+                and not _network_fs(str(file), st.st_dev)):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                # a slice at a time to every hasher, so the pages are faulted in once for all of them
+                with memoryview(mm) as view:
+                    for offset in range(0, size, BLOCK_SIZE):
+                        block = view[offset:offset + BLOCK_SIZE]
+                        for h in hs:
+                            h.update(block)
+                        block.release()
+        else:
+            _feed(f, hs, read_buffer(block_size(size)))
+
+    if algorithms is None:
+        return hs[0].hexdigest()
+
+    return {h.name: h.hexdigest() for h in hs}
+
+
+_network_devices = {}       # st_dev -> True if it is a network filesystem, see _network_fs()
+
+
+def _network_fs(path, device):
+    """
+        True if path, on device, is on a network filesystem according to
+        /proc/mounts, where a server can truncate a mapped file under us
+        and a stalled server turns page faults into hangs.  False where
+        there is no /proc/mounts.
+    """
+    if device in _network_devices:
+        return _network_devices[device]
+
+    mounts = []
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    mounts.append((fields[1].replace("\\040", " "), fields[2]))
+    except OSError:
+        pass
+
+    # the longest mount point holding path is the one it's on
+    path = os.path.realpath(path)
+    network = False
+    for mount, fstype in sorted(mounts, key=lambda m: len(m[0]), reverse=True):
+        if path == mount or path.startswith(os.path.join(mount, "")):
+            network = fstype in NETWORK_FS or fstype.startswith("nfs")
+            break
+
+    _network_devices[device] = network
+    return network
+
+
+def _set_mmap_size(size):
+    """Pool initializer, so worker processes use the parent's MMAP_SIZE however they are started"""
+    global MMAP_SIZE
+    MMAP_SIZE = size
+
+
+def parse_size(text):
+    """
+        parses a byte count like "4096", "64K", "256M", or "2G"
+    """
+    text = str(text).strip().upper()
+    scale = 1
+
+    for suffix, factor in [("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3), ("T", 1024 ** 4)]:
+        if text.endswith(suffix):
+            text = text[:-1]
+            scale = factor
+            break
+
+    return int(float(text) * scale)
+
+
+def sized_files(files):
+    """
+        stats every file up front, returns a list of (path, size) largest first
+    """
+    sized = [(f, f.stat().st_size) for f in files]
+    sized.sort(key=lambda ent: ent[1], reverse=True)
+
+    return sized
+
+
+def schedule(sized, chunk_bytes=CHUNK_BYTES, split_size=0, range_size=RANGE_SIZE, chunk_files=CHUNK_FILES,
+             workers=1):
+    """
+        turns (path, size) pairs, largest first, into work items for
+        hash_work(), in the order they should be dispatched:
+
+            ("files", [path, ...])                      -- hash whole files
+            ("range", path, start, length, index, n)    -- one range of a split file
+
+        files of at least split_size bytes (if split_size) are split into
+        range_size ranges hashed separately, see tree_label().  everything
+        else is batched so each item holds about chunk_bytes or chunk_files
+        files, whichever comes first, so a big file is an item of its own
+        and thousands of tiny files share one.  on trees too small to fill
+        ITEMS_PER_WORKER items per worker both limits shrink until they do.
+    """
+    whole = [size for path, size in sized if not (split_size and size >= split_size and size > range_size)]
+    items = workers * ITEMS_PER_WORKER
+    chunk_bytes = max(1, min(chunk_bytes, sum(whole) // items))
+    chunk_files = max(1, min(chunk_files, -(-len(whole) // items)))
+    batch = []
+    batch_bytes = 0
+
+    for path, size in sized:
+        if split_size and size >= split_size and size > range_size:
+            n = (size + range_size - 1) // range_size
+            for index in range(n):
+                start = index * range_size
+                yield "range", path, start, min(range_size, size - start), index, n
+            continue
+
+        batch.append(path)
+        batch_bytes += size
+
+        if batch_bytes >= chunk_bytes or len(batch) >= chunk_files:
+            yield "files", batch
+            batch = []
+            batch_bytes = 0
+
+    if batch:
+        yield "files", batch
+
+
+def tree_label(range_size=RANGE_SIZE, algorithm=None):
+    """
+        prefix for tree hashes, so nobody mistakes one for a plain digest.  a
+        tree hash is Hasher() of the concatenated Hasher() digests of each
+        range_size range of the file -- NOT the same as hashing the whole file.
+        algorithm names the hasher when it isn't Hasher().
+    """
+    return f"tree-{algorithm or Hasher().name}-{range_size}:"
+
+
+def hash_range(file, start, length, algorithms=None):
+    """
+        raw digests of length bytes of file starting at start, a tuple in
+        the order of hashers(algorithms)
+    """
+    hs = hashers(algorithms)
+    buf = read_buffer(block_size(length))
+
+    with open(str(file), 'rb', buffering=0) as f:
+        f.seek(start)
+        _feed(f, hs, buf, length)
+
+    return tuple(h.digest() for h in hs)
+
+
+def hash_work(item, algorithms=None, cache_path=None):
+    """
+        worker for schedule() items, returns a list of results:
+        (path, hash_file()) for whole files, or (path, (index, n, digests)) for a range.
+        with cache_path whole files go through cached_hash() and each result
+        gets a third element, True for a cache hit.  ranges are never cached,
+        a tree hash isn't the file's digest
+    """
+    if item[0] == "files":
+        if cache_path:
+            return [(fn, *cached_hash(fn, cache_path, algorithms)) for fn in item[1]]
+        return [(fn, hash_file(fn, algorithms)) for fn in item[1]]
+
+    kind, path, start, length, index, n = item
+    result = (path, (index, n, hash_range(path, start, length, algorithms)))
+    return [result + (False,)] if cache_path else [result]
+
+
+def collect_ranges(results, range_size=RANGE_SIZE, algorithms=None):
+    """
+        flattens hash_work() results and reassembles split files, yields
+        (path, digests) as each file completes, in the same shape as
+        hash_file(path, algorithms); split files get tree hashes.  anything
+        after the digest in a result, like a cache hit flag, is passed along
+    """
+    leaves = {}
+
+    for batch in results:
+        for result in batch:
+            path, digest = result[:2]
+            if not isinstance(digest, tuple):
+                yield result
+                continue
+
+            index, n, leaf = digest
+            parts = leaves.setdefault(path, {})
+            parts[index] = leaf
+
+            if len(parts) == n:
+                del leaves[path]
+                trees = {}
+                for i, h in enumerate(hashers(algorithms)):
+                    h.update(b"".join(parts[j][i] for j in range(n)))
+                    trees[h.name] = tree_label(range_size, h.name) + h.hexdigest()
+                yield (path, trees if algorithms is not None else trees.popitem()[1]) + result[2:]
+
+
+def edge_hash(file, edge=EDGE_SIZE):
+    """
+        hexdigest of the first and last edge bytes of file with Hasher().
+        for files no bigger than 2 * edge that is all of it, and the result
+        is the same as hash_file(file).
     """
     h = Hasher()
 
-    with open(str(file), 'rb') as f:
-        while True:
-            bits = f.read(BLOCK_SIZE)
-            if not bits:
-                break
-            h.update(bits)
+    with open(str(file), 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+
+        if size <= 2 * edge:
+            _feed(f, [h], read_buffer(max(size, 1)))
+        else:
+            buf = read_buffer(edge)
+            _feed(f, [h], buf, edge)
+            f.seek(size - edge)
+            _feed(f, [h], buf, edge)
 
     return h.hexdigest()
 
 
-def parse_args():
+def _edge_worker(item, edge=EDGE_SIZE):
+    path, size = item
+    return path, size, edge_hash(path, edge)
+
+
+def _full_worker(item, cache_path=None):
+    path, key = item
+    if cache_path:
+        return (path, key, *cached_hash(path, cache_path))
+    return path, key, hash_file(path), False
+
+
+def find_duplicates(pool, sized, edge=EDGE_SIZE, min_size=1, counts=None, stats=None, cache_path=None):
+    """
+        generates (size, hexdigest, [paths]) for each group of identical
+        files among the (path, size) pairs in sized, as each is confirmed.
+
+        only files sharing a size are read at all, and then only edge bytes
+        from each end (see edge_hash()).  files still colliding after that
+        are hashed in full on pool, biggest first.  small files are settled
+        by the edge hash alone, since it covers the whole file.
+
+        :param pool: multiprocessing Pool to hash on
+        :param min_size: ignore files smaller than this, 1 skips empty files
+        :param counts: optional dict, gets "edge_files", "edge_bytes", "full_files", and "full_bytes" read,
+                       and "full_hits", full hashes found in the cache
+        :param stats: optional Stats to time the hashing with
+        :param cache_path: HashCache to look full hashes up in and save them to, see cached_hash()
+    """
+    stats = stats or Stats(enabled=False)
+    counts = {} if counts is None else counts
+    for key in ["edge_files", "edge_bytes", "full_files", "full_bytes", "full_hits"]:
+        counts.setdefault(key, 0)
+
+    by_size = {}
+    for path, size in sized:
+        if size >= min_size:
+            by_size.setdefault(size, []).append(path)
+
+    candidates = [(path, size) for size in sorted(by_size, reverse=True) if len(by_size[size]) > 1
+                  for path in by_size[size]]
+    remaining = {size: len(paths) for size, paths in by_size.items() if len(paths) > 1}
+    edges = {}
+    collisions = []
+
+    for path, size, digest in stats.imap(pool, partial(_edge_worker, edge=edge), candidates, chunksize=64):
+        counts["edge_files"] += 1
+        counts["edge_bytes"] += min(size, 2 * edge)
+        edges.setdefault(size, {}).setdefault(digest, []).append(path)
+
+        remaining[size] -= 1
+        if remaining[size]:
+            continue
+
+        for digest, paths in edges.pop(size).items():
+            if len(paths) < 2:
+                continue
+            if size <= 2 * edge:
+                yield size, digest, paths
+            else:
+                collisions.append((size, digest, paths))
+
+    collisions.sort(key=lambda group: group[0], reverse=True)
+    remaining = {(size, digest): len(paths) for size, digest, paths in collisions}
+    work = [(path, (size, digest)) for size, digest, paths in collisions for path in paths]
+    fulls = {}
+
+    for path, key, digest, hit in stats.imap(pool, partial(_full_worker, cache_path=cache_path), work):
+        counts["full_files"] += 1
+        counts["full_hits"] += hit
+        counts["full_bytes"] += 0 if hit else key[0]
+        fulls.setdefault(key, {}).setdefault(digest, []).append(path)
+
+        remaining[key] -= 1
+        if remaining[key]:
+            continue
+
+        for digest, paths in fulls.pop(key).items():
+            if len(paths) > 1:
+                yield key[0], digest, paths
+
+
+class SerialPool:
+    """
+        runs everything in the calling thread, but looks enough like a
+        multiprocessing Pool for the drivers and imap_bounded()
+    """
+
+    def __init__(self, processes=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap_unordered(self, fn, items, chunksize=1):
+        return map(fn, items)
+
+    def apply_async(self, fn, args=(), kwds=None, callback=None, error_callback=None):
+        try:
+            rc = fn(*args, **(kwds or {}))
+        except Exception as e:
+            if error_callback is None:
+                raise
+            error_callback(e)
+            return
+
+        if callback is not None:
+            callback(rc)
+
+
+def choose_executor(args):
+    """
+        resolves --executor and --workers, returns (executor, workers, reason).
+
+        auto stats the first CALIBRATE_FILES files of the walk.  hashlib drops
+        the GIL while it hashes big buffers, so trees of big files go to
+        threads, which skip pickling paths and results between processes.
+        small files spend most of their time in python holding the GIL, so
+        they go to processes.  with one cpu or a handful of files neither
+        pays for itself.
+    """
+    workers = args.workers or cpu_count()
+
+    if args.executor != "auto":
+        return args.executor, 1 if args.executor == "sequential" else workers, "requested"
+
+    sizes = []
+    for fn in itertools.islice(walk(args), CALIBRATE_FILES):
+        try:
+            sizes.append(os.stat(fn).st_size)
+        except OSError:
+            pass
+
+    mean = sum(sizes) // len(sizes) if sizes else 0
+
+    if workers < 2 or cpu_count() < 2:
+        return "sequential", 1, f"only {min(workers, cpu_count())} cpu or worker"
+
+    if len(sizes) < 2 * workers:
+        return "sequential", 1, f"only {len(sizes)} files for {workers} workers"
+
+    if mean >= THREAD_MIN_BYTES:
+        return "threads", workers, f"mean size {mean} bytes of {len(sizes)} files is at least {THREAD_MIN_BYTES}, " \
+                                   f"hashing big buffers releases the GIL"
+
+    return "processes", workers, f"mean size {mean} bytes of {len(sizes)} files is under {THREAD_MIN_BYTES}, " \
+                                 f"small files are mostly python holding the GIL"
+
+
+def make_pool(executor, workers):
+    """a Pool, ThreadPool, or SerialPool for choose_executor()'s result"""
+    if executor == "processes":
+        return Pool(workers, initializer=_set_mmap_size, initargs=(MMAP_SIZE,))
+
+    if executor == "threads":
+        return ThreadPool(workers)
+
+    return SerialPool()
+
+
+def _label(item):
+    """what to call a work item in the --stats slowest list"""
+    if isinstance(item, tuple):
+        if item[0] == "files":
+            return f"{len(item[1])} files from {item[1][0]}"
+        if item[0] == "range":
+            return f"{item[1]} range {item[4] + 1}/{item[5]}"
+        return str(item[0])
+
+    return str(item)
+
+
+def timed(fn, stamped):
+    """
+        worker wrapper used by Stats, runs fn on an item stamped with the
+        time it was queued and returns (fn's result, sample), where sample
+        is a small tuple of numbers so the parent gets it almost for free:
+
+            (worker, queue wait, seconds, read seconds, hash seconds, bytes, label)
+    """
+    queued, item = stamped
+    waited = max(time.time() - queued, 0.0)
+    timing = _local.timing = [0.0, 0.0, 0]
+    start = time.perf_counter()
+
+    try:
+        rc = fn(item)
+    finally:
+        _local.timing = None
+
+    seconds = time.perf_counter() - start
+    worker = f"{os.getpid()}/{threading.current_thread().name}"
+
+    return rc, (worker, waited, seconds, timing[0], timing[1], timing[2], _label(item))
+
+
+class Stats:
+    """
+        timings for --stats: wall time per phase of a run, and per work
+        item queue wait, read time, hash time, and bytes from the workers
+        (see timed()).  a disabled Stats passes everything straight through.
+    """
+
+    def __init__(self, enabled=True, slowest=SLOWEST):
+        self.enabled = enabled
+        self.slowest = slowest
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.within = {}        # phase -> the phase it ran inside of, so its time is counted twice
+        self.workers = {}
+        self.heap = []
+        self.items = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """times the with block as phase name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def iterate(self, name, items, within=None):
+        """
+            generates items, the time spent producing them goes to phase name.
+            within names the phase the loop consuming them is timed as, if any
+        """
+        if within:
+            self.within[name] = within
+
+        if not self.enabled:
+            yield from items
+            return
+
+        it = iter(items)
+
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_phase(name, time.perf_counter() - start)
+                return
+            self.add_phase(name, time.perf_counter() - start)
+            yield item
+
+    def stamp(self, items):
+        for item in items:
+            yield time.time(), item
+
+    def collect(self, results):
+        """strips the samples off timed() results, generates the results"""
+        for rc, sample in results:
+            self.add(sample)
+            yield rc
+
+    def add(self, sample):
+        worker, waited, seconds, read, hashed, nbytes, label = sample
+
+        self.items += 1
+        self.waited += waited
+        self.max_wait = max(self.max_wait, waited)
+
+        w = self.workers.setdefault(worker, {"items": 0, "busy": 0.0, "read": 0.0, "hash": 0.0, "bytes": 0})
+        w["items"] += 1
+        w["busy"] += seconds
+        w["read"] += read
+        w["hash"] += hashed
+        w["bytes"] += nbytes
+
+        entry = (seconds, self.items, {"item": label, "seconds": round(seconds, 6), "wait": round(waited, 6),
+                                       "read": round(read, 6), "hash": round(hashed, 6), "bytes": nbytes})
+        if len(self.heap) < self.slowest:
+            heapq.heappush(self.heap, entry)
+        elif self.slowest:
+            heapq.heappushpop(self.heap, entry)
+
+    def imap(self, pool, fn, items, chunksize=1):
+        """pool.imap_unordered(fn, items), timed when enabled"""
+        if not self.enabled:
+            return pool.imap_unordered(fn, items, chunksize=chunksize)
+
+        return self.collect(pool.imap_unordered(partial(timed, fn), self.stamp(items), chunksize=chunksize))
+
+    def imap_bounded(self, pool, fn, items, depth):
+        """imap_bounded(pool, fn, items, depth), timed when enabled"""
+        if not self.enabled:
+            return imap_bounded(pool, fn, items, depth)
+
+        return self.collect(imap_bounded(pool, partial(timed, fn), self.stamp(items), depth))
+
+    def report(self, **extra):
+        """everything as a dict ready for json, extra is copied in first"""
+        elapsed = time.perf_counter() - self.start
+        read = sum(w["read"] for w in self.workers.values())
+        hashed = sum(w["hash"] for w in self.workers.values())
+        nbytes = sum(w["bytes"] for w in self.workers.values())
+
+        workers = {}
+        for name, w in sorted(self.workers.items()):
+            workers[name] = {k: round(v, 6) if isinstance(v, float) else v for k, v in w.items()}
+            workers[name]["bytes_per_sec"] = round(w["bytes"] / w["busy"]) if w["busy"] else None
+
+        rc = dict(extra)
+        rc.update({
+            "elapsed": round(elapsed, 6),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "phases_within": dict(self.within),
+            "items": self.items,
+            "queue_wait": {
+                "total": round(self.waited, 6),
+                "mean": round(self.waited / self.items, 6) if self.items else 0.0,
+                "max": round(self.max_wait, 6),
+            },
+            "read_seconds": round(read, 6),
+            "hash_seconds": round(hashed, 6),
+            "bytes": nbytes,
+            "bytes_per_sec": round(nbytes / elapsed) if elapsed else None,
+            "bound": "io" if read > hashed else "cpu",
+            "per_worker": workers,
+            "slowest": [entry[2] for entry in sorted(self.heap, reverse=True)],
+        })
+
+        return rc
+
+
+def print_stats(stats, fmt, file=None, **extra):
+    """writes stats.report() as json or a few lines of text, to stderr by default"""
+    file = file or sys.stderr
+    rc = stats.report(**extra)
+
+    if fmt == "json":
+        json.dump(rc, file, indent=2)
+        print(file=file)
+        return
+
+    phases = ", ".join(f"{name} {seconds:.3f}s" + (f" (part of {rc['phases_within'][name]})"
+                                                  if name in rc["phases_within"] else "")
+                       for name, seconds in rc["phases"].items())
+    print(f"stats: {rc['elapsed']:.3f}s elapsed, {phases}", file=file)
+    print(f"stats: {rc['items']} items, queue wait mean {rc['queue_wait']['mean']:.6f}s max {rc['queue_wait']['max']:.3f}s, "
+          f"read {rc['read_seconds']:.3f}s, hash {rc['hash_seconds']:.3f}s, {rc['bytes']} bytes, "
+          f"looks {rc['bound']} bound", file=file)
+    for name, w in rc["per_worker"].items():
+        print(f"stats: worker {name}: {w['items']} items, {w['bytes']} bytes, {w['bytes_per_sec']} bytes/sec", file=file)
+    for entry in rc["slowest"]:
+        print(f"stats: slow {entry['seconds']:.3f}s {entry['item']}", file=file)
+
+
+def imap_bounded(pool, fn, items, depth):
+    """
+        like pool.imap_unordered(fn, items), but only pulls the next item
+        from items when fewer than depth are in flight, so a slow or huge
+        generator (like all_files()) is consumed as the workers keep up
+        instead of all at once.  results are generated as they complete.
+    """
+    done = queue.Queue()
+    pending = 0
+
+    def collect(rc):
+        if isinstance(rc, BaseException):
+            raise rc
+        return rc
+
+    for item in items:
+        while pending >= depth:
+            yield collect(done.get())
+            pending -= 1
+
+        pool.apply_async(fn, (item,), callback=done.put, error_callback=done.put)
+        pending += 1
+
+        while not done.empty():
+            yield collect(done.get_nowait())
+            pending -= 1
+
+    while pending:
+        yield collect(done.get())
+        pending -= 1
+
+
+class HashCache:
+    """
+        on-disk cache of file digests in sqlite.  an entry is good while the
+        file's size, mtime_ns, and inode are unchanged, so reruns over an
+        unchanged tree only stat files.
+
+        the database runs in WAL mode with a busy timeout, so every Pool
+        worker can open its own connection and write without corrupting
+        or blocking readers; writers simply take turns.
+    """
+
+    def __init__(self, path, timeout=CACHE_TIMEOUT):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " path TEXT NOT NULL, algorithm TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " PRIMARY KEY (path, algorithm))"
+        )
+
+    def lookup(self, path, st, algorithm):
+        """cached digest of path if st still matches, else None"""
+        row = self.db.execute(
+            "SELECT digest FROM hashes"
+            " WHERE path = ? AND algorithm = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (path, algorithm, st.st_size, st.st_mtime_ns, st.st_ino),
+        ).fetchone()
+
+        return row[0] if row else None
+
+    def store(self, path, st, algorithm, digest):
+        self.db.execute(
+            "INSERT OR REPLACE INTO hashes (path, algorithm, size, mtime_ns, inode, digest)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (path, algorithm, st.st_size, st.st_mtime_ns, st.st_ino, digest),
+        )
+
+    def evict(self, root, seen=()):
+        """
+            drops entries below root for files that no longer exist, returns
+            how many.  files the walk skipped (--include, --exclude, links,
+            other filesystems, unreadable directories) keep their entries;
+            paths in seen are known to exist and aren't stat'ed again
+        """
+        prefix = os.path.join(os.path.abspath(root), "")
+        seen = {os.path.abspath(p) for p in seen}
+
+        # substr() rather than LIKE, which ignores ASCII case
+        paths = {row[0] for row in self.db.execute(
+            "SELECT DISTINCT path FROM hashes WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+        gone = [(path,) for path in paths - seen if not os.path.lexists(path)]
+
+        self.db.execute("BEGIN")
+        self.db.executemany("DELETE FROM hashes WHERE path = ?", gone)
+        self.db.execute("COMMIT")
+
+        return len(gone)
+
+    def close(self):
+        self.db.close()
+
+
+def cached_hash(file, cache_path, algorithms=None):
+    """
+        hash_file() through the HashCache at cache_path, returns (digests, hit).
+        only the algorithms missing from the cache are computed, still in one
+        read.  each process or thread opens its own connection on first use.
+    """
+    cache = getattr(_local, "cache", None)
+
+    if cache is None or cache.path != cache_path:
+        cache = _local.cache = HashCache(cache_path)
+
+    path = os.path.abspath(file)
+    names = [h.name for h in hashers(algorithms)]
+    st = os.stat(path)
+    digests = {name: cache.lookup(path, st, name) for name in names}
+    missing = [name for name in names if digests[name] is None]
+    hit = not missing
+
+    if missing:
+        digests.update(hash_file(path, missing))
+
+        # don't remember a digest if the file changed while we read it
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns, after.st_ino) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            for name in missing:
+                cache.store(path, st, name, digests[name])
+
+    return (digests if algorithms is not None else digests[names[0]]), hit
+
+
+def cached_worker(cache_path, fn, algorithms=None):
+    """worker for the drivers when --cache is given, use with functools.partial()"""
+    digests, hit = cached_hash(fn, cache_path, algorithms)
+    return fn, digests, hit
+
+
+def close_cache(cache_path, root, seen, hits, file=None, total=None):
+    """
+        evicts cache entries below root for files that are gone and prints
+        the hit ratio over the files in seen, or over total lookups if given
+    """
+    cache = HashCache(cache_path)
+    evicted = cache.evict(root, seen)
+    cache.close()
+
+    total = len(seen) if total is None else total
+    ratio = hits / total if total else 0.0
+    print(f"cache {cache_path}: {hits} hits, {total - hits} misses, {ratio:.1%} hit ratio, {evicted} evicted",
+          file=file or sys.stdout)
+
+
+def parse_args(**defaults):
+    """
+        command line for the drivers, defaults overrides argument defaults
+    """
     ap = argparse.ArgumentParser()
     ap.add_argument("root")
+    ap.add_argument("--executor", type=str, default="auto", choices=EXECUTORS,
+                    help="hash in this process, on threads, or on processes, auto picks one from the file sizes")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="threads or processes to hash with, default one per cpu")
+    ap.add_argument("--include", action="append", default=None,
+                    help="only hash files whose name or relative path matches this glob, may be repeated")
+    ap.add_argument("--exclude", action="append", default=None,
+                    help="skip files and directories whose name or relative path matches this glob, may be repeated")
+    ap.add_argument("--follow-links", type=str, default="files", choices=FOLLOW_LINKS,
+                    help="never: skip symlinks, files: hash linked files but don't enter linked directories, "
+                         "all: follow everything")
+    ap.add_argument("--one-filesystem", action="store_true", default=False,
+                    help="don't cross into other filesystems below root")
+    ap.add_argument("--walk-threads", type=int, default=0,
+                    help="list this many directories at once, helps on network filesystems")
+    ap.add_argument("--no-mmap", action="store_true", default=False,
+                    help="read big files instead of mapping them, for trees that change while they are hashed: "
+                         "truncating a mapped file kills the worker with SIGBUS")
+    ap.add_argument("--stream", action="store_true", default=False,
+                    help="hash files as the walk finds them and print each result as it completes")
+    ap.add_argument("--depth", type=int, default=cpu_count() * PENDING_PER_WORKER,
+                    help="files in flight when streaming")
+    ap.add_argument("--schedule", action="store_true", default=False,
+                    help="stat files first, dispatch largest first, batch small files by total bytes")
+    ap.add_argument("--chunk-files", type=int, default=CHUNK_FILES,
+                    help="most files in one --schedule work item")
+    ap.add_argument("--chunk-bytes", type=parse_size, default=CHUNK_BYTES,
+                    help="bytes of small files per batch with --schedule")
+    ap.add_argument("--split-size", type=parse_size, default=0,
+                    help="with --schedule, split files at least this big into ranges and tree hash them "
+                         "(the result is NOT the plain digest of the file)")
+    ap.add_argument("--range-size", type=parse_size, default=RANGE_SIZE,
+                    help="range length for --split-size")
+    ap.add_argument("--dedup", action="store_true", default=False,
+                    help="report groups of identical files, reading as little of each as possible")
+    ap.add_argument("--edge-size", type=parse_size, default=EDGE_SIZE,
+                    help="with --dedup, bytes read from each end of same size files before hashing them in full")
+    ap.add_argument("--min-size", type=parse_size, default=1,
+                    help="with --dedup, ignore files smaller than this")
+    ap.add_argument("--stats", type=str, default=None, choices=["text", "json"],
+                    help="time the walk, queueing, reads, and hashing, and report it on stderr at the end")
+    ap.add_argument("--slowest", type=int, default=SLOWEST,
+                    help="work items to list in the --stats report")
+    ap.add_argument("--cache", type=str, default=None,
+                    help="sqlite file remembering digests between runs")
+    ap.add_argument("--algorithms", type=parse_algorithms, default=None,
+                    help="comma separated hashlib algorithms, e.g. sha256,md5,blake2b, all computed "
+                         f"in one read of each file (default {Hasher().name})")
+    ap.set_defaults(**defaults)
 
     return ap.parse_args()
 
@@ -59,5 +1117,6 @@ if __name__ == "__main__":
     # test code
     args = parse_args()
     print(f"{args.root=}")
-    files = [f for f in all_files(args.root)]
-    print(f"{len(files)=}")
+    start = time.perf_counter()
+    files = [f for f in walk(args)]
+    print(f"{len(files)=} in {time.perf_counter()-start:.3f} seconds")
@@ -7,6 +7,8 @@
 
 import progressbar
 
+from throttle import throttled
+
 
 def calc_pi(limit):  # Generator function
     """
@@ -56,18 +58,14 @@ def main():
 
     zeros = 0
     m = 50_000
-    idx = 0
 
     print(f"Calculating pi to {m} significant digits\n\n")
 
-    with progressbar.ProgressBar(max_value=m, widgets=widgets) as bar:
-        for digit in calc_pi(m + 2):
-            if digit == 0:
-                zeros += 1
-
-            if idx % 100 == 0:
-                bar.update(idx)
-            idx += 1
+    # the bar is redrawn ten times a second however fast the digits come.  calc_pi(m + 2)
+    # yields m + 3 digits and the decimal point
+    for digit in throttled(calc_pi(m + 2), progressbar.ProgressBar(max_value=m + 4, widgets=widgets)):
+        if digit == 0:
+            zeros += 1
 
     print(f"zeros in pi to {m} places are {zeros}")
 
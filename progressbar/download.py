@@ -1,15 +1,72 @@
 #!/usr/bin/env python3
 """
     demonstrate downloading a large file with a progressbar
+
+    when the server takes Range requests and tells us how big the file is,
+    the file is split into segments fetched at the same time over one pooled
+    session, each written straight to its place in the target file.
+    otherwise it comes down a single stream.  serve.py is a local server to
+    try both against.
+
+    ranged downloads keep a journal of the byte ranges already on disk in
+    target.journal, so running the same download again after it dies picks
+    up where it stopped, as long as the server's ETag or Last-Modified
+    says the file hasn't changed.
+
+    Usage:
+
+        python3 ./download.py
+            [url [target]]      -- default is a CALFIRE geojson file
+            [--segments n]      -- concurrent range requests, default 8
+            [--digest algorithm[:hexdigest]]
+                                -- hash the file as it is written, e.g. sha512, and check it if a digest is given
+            [--verbose]
+
+        python3 ./download.py --many file
+            [--directory dir]   -- where to put them, default .
+            [--concurrency n]   -- files at once, default 4
+            [--per-host n]      -- files at once from one host, default 2
+            [--retries n]       -- extra attempts per file, default 3
+            [--segments n]      -- ranges per file, default 1
+
+        downloads every url listed in file, one per line
 """
 
+import argparse
+import hashlib
+import heapq
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import progressbar
 import requests
+from requests.adapters import HTTPAdapter
+
+from throttle import Throttled
 
 Verbose = False
 
+SEGMENTS = 8                    # concurrent range requests
+MIN_SEGMENT = 1024 * 1024       # never split into segments smaller than this
+PIECE = 16 * 1024 * 1024        # largest range one request fetches, see download_ranges()
+MIN_CHUNK = 64 * 1024           # smallest read from a response
+MAX_CHUNK = 4 * 1024 * 1024     # largest read, and the most buffer one stream holds
+CHUNK_SECONDS = 0.05            # aim for reads that take about this long at the measured rate
+JOURNAL_BYTES = 16 * 1024 * 1024    # new bytes on disk between journal saves
+JOURNAL_SUFFIX = ".journal"
+CONCURRENCY = 4                 # files download_many() fetches at once
+PER_HOST = 2                    # of those, at most this many from any one host
+RETRIES = 3                     # extra attempts per file
+BACKOFF = 1.0                   # seconds before the first retry, doubling after that
+
 
-def download(url, target):
+def download(url, target, segments=SEGMENTS, session=None, algorithm=None, expected=None, multibar=None):
     """
     Loosely inspired by:
 
@@ -21,7 +78,12 @@ def download(url, target):
 
     :param url: url to download
     :param target:  filename to save to
-    :return: nothing
+    :param segments: how many ranges to fetch at once
+    :param session: requests.Session to use, default is one from make_session()
+    :param algorithm: hashlib algorithm to hash the file with as it is written
+    :param expected: hexdigest the file must have, raises ValueError if it doesn't
+    :param multibar: progressbar.MultiBar to add our bar to, see download_many()
+    :return: the hexdigest if algorithm was given, else None
     """
 
     name = url.split('/')[-1]
@@ -29,36 +91,704 @@ def download(url, target):
     if Verbose:
         print(f"[info] Downloading {name}")
 
-    # if the server doesn't give us a content-length, we will get an error here.  ooops.
-    r = requests.get(url, stream=True, allow_redirects=True)
-    total_size = int(r.headers.get('content-length'))
+    if expected and not algorithm:
+        raise ValueError("an expected digest needs an algorithm")
+
+    session = session or make_session(segments)
+    r, total, ranged = probe(session, url)
+
+    if total == 0:
+        # nothing to fetch, and a 416's body is the server's error page, not the file
+        r.close()
+
+        if Verbose:
+            print(f"[info] empty file")
+
+        open(target, 'wb').close()
+        digest = hashlib.new(algorithm).hexdigest() if algorithm else None
+    elif ranged and total >= 2 * MIN_SEGMENT:
+        r.close()
+
+        if Verbose:
+            print(f"[info] {total} bytes in up to {segments} ranges")
+
+        digest = download_ranges(session, r.url, target, total, segments, validators(r), algorithm, multibar)
+    else:
+        if ranged:
+            # our probe only asked for the first byte, start over for the whole file
+            r.close()
+            r = session.get(r.url, stream=True)
+            r.raise_for_status()
+
+        if Verbose:
+            print(f"[info] single stream, {'no ranges' if not ranged else 'small file'}, {total=}")
+
+        digest = download_stream(r, target, total, algorithm, multibar)
+
+    if expected and digest != expected.lower():
+        raise ValueError(f"{target}: {algorithm} is {digest}, expected {expected}")
+
+    return digest
+
+
+def make_session(segments=SEGMENTS):
+    """a requests.Session whose connection pool can hold segments connections per host"""
+    session = requests.Session()
+    # we want the bytes of the file as they are, which also keeps content-length and ranges honest
+    session.headers["Accept-Encoding"] = "identity"
+    adapter = HTTPAdapter(pool_connections=segments, pool_maxsize=segments)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def probe(session, url):
+    """
+    asks for the first byte of url to learn if the server takes ranges
+
+    :return: (response, total size or None, True if ranges work).  without
+             ranges the response is the whole file, ready to stream.  an
+             empty file comes back as size 0 without ranges, and its
+             response may be a 416 whose body is an error page
+    """
+
+    r = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, allow_redirects=True)
+
+    if r.status_code == 416:
+        # an empty file has no byte 0 to send, download() won't read this response
+        if re.fullmatch(r"bytes\s+\*/0", r.headers.get("content-range", "").strip()):
+            return r, 0, False
+
+        # otherwise the server doesn't like our range, ask for the file without one
+        r.close()
+        r = session.get(r.url, stream=True)
+
+    r.raise_for_status()
+
+    if r.status_code == 206:
+        m = re.fullmatch(r"bytes\s+0-0/(\d+)", r.headers.get("content-range", "").strip())
+        if m:
+            return r, int(m.group(1)), True
+
+        # a range response that won't say how big the file is is no use to us
+        r.close()
+        r = session.get(r.url, stream=True)
+        r.raise_for_status()
+
+    length = r.headers.get("content-length")
+    return r, int(length) if length is not None else None, False
+
+
+def validators(r):
+    """what identifies this version of the remote file: its ETag and Last-Modified headers"""
+    return {"etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified")}
+
+
+class Journal:
+    """
+    the byte ranges of a ranged download that are safely on disk, kept as
+    json next to the target so a later run can resume.  the journal is only
+    saved after the data it describes has been fsync'ed, and is replaced
+    atomically, so a crash leaves either the old journal or the new one.
+    """
+
+    def __init__(self, target, url, size, validators):
+        self.path = target + JOURNAL_SUFFIX
+        self.url = url
+        self.size = size
+        self.validators = validators
+        self.done = []      # sorted, non-overlapping [start, end) pairs
+        self.unsaved = 0
+        self.lock = threading.Lock()
+
+    def resume(self):
+        """
+        loads an earlier journal for the same file if there is one.
+        returns False, and starts from nothing, if the remote can't be
+        shown to be unchanged
+        """
+        try:
+            with open(self.path) as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if old.get("url") != self.url or old.get("size") != self.size:
+            return False
+
+        mine, theirs = self.validators, old.get("validators", {})
+        if mine.get("etag") and theirs.get("etag"):
+            same = mine["etag"] == theirs["etag"]
+        elif mine.get("last_modified") and theirs.get("last_modified"):
+            same = mine["last_modified"] == theirs["last_modified"]
+        else:
+            same = False
+
+        if not same:
+            return False
+
+        self.done = [tuple(rng) for rng in old.get("done", [])]
+        return True
+
+    def if_range(self):
+        """If-Range header value, so the server sends 200 instead of a range of a changed file"""
+        etag = self.validators.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag
+        return self.validators.get("last_modified")
+
+    def missing(self):
+        """[start, end) pairs not on disk yet"""
+        gaps = []
+        position = 0
+
+        with self.lock:
+            for start, end in self.done:
+                if start > position:
+                    gaps.append((position, start))
+                position = max(position, end)
 
-    widgets = [
-        target + ":",
-        ' ', progressbar.Percentage(),
+        if position < self.size:
+            gaps.append((position, self.size))
+
+        return gaps
+
+    def contiguous(self):
+        """how many bytes from the start of the file are on disk"""
+        with self.lock:
+            return self.done[0][1] if self.done and self.done[0][0] == 0 else 0
+
+    def add(self, start, end, fd):
+        """records [start, end) as written to fd, saving every JOURNAL_BYTES"""
+        with self.lock:
+            merged = []
+            for rng in sorted(self.done + [(start, end)]):
+                if merged and rng[0] <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], rng[1]))
+                else:
+                    merged.append(rng)
+            self.done = merged
+            self.unsaved += end - start
+
+            if self.unsaved >= JOURNAL_BYTES:
+                self._save(fd)
+
+    def save(self, fd):
+        with self.lock:
+            self._save(fd)
+
+    def _save(self, fd):
+        os.fsync(fd)
+
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"url": self.url, "size": self.size, "validators": self.validators, "done": self.done}, f)
+        os.replace(tmp, self.path)
+
+        self.unsaved = 0
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Digester:
+    """
+    hashes a file being written out of order, in order: whenever more of
+    the start of the file is complete it reads those bytes back and hashes
+    them, so the digest is ready soon after the last range lands.
+    download_ranges() hands out small pieces in offset order to keep that
+    frontier just behind the writes, so the bytes read back are normally
+    still in the page cache and not a second pass over the disk; a piece
+    that stalls holds the frontier back until it lands
+    """
+
+    def __init__(self, algorithm, target):
+        self.hasher = hashlib.new(algorithm)
+        self.f = open(target, 'rb', buffering=0)     # unbuffered, a read-ahead buffer could hold bytes not written yet
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def advance(self, upto, wait=False):
+        """hashes up to byte upto, unless another thread is already busy hashing and wait is False"""
+        if not self.lock.acquire(blocking=wait):
+            return
+
+        try:
+            self.f.seek(self.position)
+            while self.position < upto:
+                data = self.f.read(min(MAX_CHUNK, upto - self.position))
+                if not data:
+                    break
+                self.hasher.update(data)
+                self.position += len(data)
+        finally:
+            self.lock.release()
+
+    def hexdigest(self):
+        self.f.close()
+        return self.hasher.hexdigest()
+
+
+def widgets(target, total_size=None):
+    """
+    our bar, or a bouncing one with a byte count when we don't know how big
+    the file is.  no target means no label, a MultiBar adds its own
+    """
+    label = [target + ":", ' '] if target else []
+
+    if total_size is None:
+        return label + [
+            progressbar.DataSize(),
+            ' ', progressbar.BouncingBar(),
+            ' ', progressbar.Timer(),
+            ' ', progressbar.AdaptiveTransferSpeed(),
+        ]
+
+    return label + [
+        progressbar.Percentage(),
         ' ', progressbar.GranularBar(),
         ' ', progressbar.AdaptiveETA(),
         ' ', progressbar.AdaptiveTransferSpeed(),
     ]
 
+
+def progress_bar(target, total_size, multibar=None):
+    """
+    a Throttled ProgressBar for downloading target, to use with "with".  in
+    a multibar it is one of its lines, labeled with target
+    """
+    max_value = total_size if total_size is not None else progressbar.UnknownLength
+
+    if multibar is None:
+        return Throttled(progressbar.ProgressBar(widgets=widgets(target, total_size), max_value=max_value))
+
+    bar = progressbar.ProgressBar(widgets=widgets(None, total_size), max_value=max_value)
+    multibar[os.path.basename(target)] = bar
+    return Throttled(bar)
+
+
+class ChunkSizer:
+    """
+    picks how much to read next from a response: a power of two between
+    MIN_CHUNK and MAX_CHUNK that takes about CHUNK_SECONDS at the throughput
+    measured so far, so fast links do few big reads and slow ones still
+    show progress
+    """
+
+    def __init__(self):
+        self.size = MIN_CHUNK
+        self.rate = None
+
+    def measured(self, n, seconds):
+        rate = n / max(seconds, 1e-6)
+        self.rate = rate if self.rate is None else 0.75 * self.rate + 0.25 * rate
+        want = int(self.rate * CHUNK_SECONDS)
+        self.size = min(MAX_CHUNK, max(MIN_CHUNK, 1 << max(want - 1, 0).bit_length()))
+
+
+def readinto_for(r):
+    """
+    the readinto() to read response r's body with.  for a plain body that's
+    http.client's own under urllib3, which fills our buffer straight from
+    the socket; urllib3's readinto() reads into a new bytes and copies it.
+    returns (readinto, True if it bypasses urllib3)
+
+    r.raw._fp is private to urllib3, checked against urllib3 2.8.0.  we
+    only go around urllib3 when it is the http.client.HTTPResponse we
+    expect and urllib3 hasn't read any of the body yet.  urllib3 then
+    doesn't count what we read, so the callers check the length themselves
+    """
+    fp = getattr(r.raw, "_fp", None)
+
+    if (r.headers.get("content-encoding", "identity") == "identity"
+            and isinstance(fp, http.client.HTTPResponse) and not fp.closed and r.raw.tell() == 0):
+        return fp.readinto, True
+
+    r.raw.decode_content = True
+    return r.raw.readinto, False
+
+
+def stream_into(r, sink, stop=None):
+    """
+    reads the body of response r with readinto() into one reused buffer,
+    calling sink(view) with a memoryview of each read -- only valid during
+    the call, nothing is copied.  read sizes follow a ChunkSizer.
+
+    :param stop: optional threading.Event, stop reading when it's set
+    :return: bytes read
+    """
+    readinto, direct = readinto_for(r)
+    sizer = ChunkSizer()
+    buffer = bytearray(sizer.size)
+    total = 0
+
+    while stop is None or not stop.is_set():
+        if len(buffer) < sizer.size:
+            buffer = bytearray(sizer.size)
+
+        view = memoryview(buffer)[:sizer.size]
+        start = time.perf_counter()
+        n = readinto(view)
+        if not n:
+            if direct:
+                # we read it all behind urllib3's back, let it have the connection back for reuse
+                r.raw.release_conn()
+            break
+
+        sizer.measured(n, time.perf_counter() - start)
+        sink(view[:n])
+        total += n
+
+    return total
+
+
+def write_at(f):
+    """a function writing bytes at an offset of open file f, with os.pwrite() where there is one"""
+    if hasattr(os, "pwrite"):
+        fd = f.fileno()
+
+        def pwrite(data, offset):
+            data = memoryview(data)
+            while data:
+                n = os.pwrite(fd, data, offset)
+                data = data[n:]
+                offset += n
+
+        return pwrite
+
+    lock = threading.Lock()
+
+    def write(data, offset):
+        with lock:
+            f.seek(offset)
+            f.write(data)
+
+    return write
+
+
+def download_stream(r, target, total_size, algorithm=None, multibar=None):
+    """
+    writes response r to target as it arrives, total_size may be None.
+    returns the hexdigest with algorithm, if given
+    """
+
     location = 0
+    hasher = hashlib.new(algorithm) if algorithm else None
+
+    with progress_bar(target, total_size, multibar) as bar, \
+         open(target, 'wb', buffering=0) as f, r:
+
+        def sink(view):
+            nonlocal location
+
+            # f is unbuffered, a raw write may take less than all of view
+            rest = view
+            while rest:
+                rest = rest[f.write(rest):]
+            location += len(view)
+
+            if hasher:
+                hasher.update(view)
+
+            if total_size is None or location <= total_size:
+                bar.update(location)
 
-    with progressbar.ProgressBar(widgets=widgets, max_value=total_size).start() as bar, \
-         open(target, 'wb') as f:
-        for ch in r.iter_content(chunk_size=1024):
-            if ch:
-                if location <= total_size:
+        stream_into(r, sink)
+
+    if total_size is not None and location != total_size:
+        raise requests.exceptions.ChunkedEncodingError(f"{target}: got {location} of {total_size} bytes")
+
+    return hasher.hexdigest() if hasher else None
+
+
+def download_ranges(session, url, target, total_size, segments=SEGMENTS, validators=None, algorithm=None,
+                    multibar=None):
+    """
+    fetches url in up to segments byte ranges at once, each written at its
+    offset in target, which is preallocated to total_size first.  what's
+    missing is cut into pieces of at most PIECE bytes handed out in offset
+    order, so all the writes stay close together and the Digester can keep
+    up.  progress goes in a Journal, and an earlier journal for the same
+    remote file is picked up so only what's missing is fetched.  returns
+    the hexdigest with algorithm, if given
+    """
+
+    journal = Journal(target, url, total_size, validators or {})
+    resumed = os.path.exists(target) and journal.resume()
+
+    if Verbose and resumed:
+        print(f"[info] resuming {target}, {total_size - sum(e - s for s, e in journal.missing())} bytes already done")
+    elif Verbose and os.path.exists(journal.path):
+        print(f"[info] {journal.path} doesn't match the remote file, starting over")
+
+    if not resumed:
+        journal.done = []
+
+    gaps = journal.missing()
+    size = max(MIN_SEGMENT, min(PIECE, -(-sum(end - start for start, end in gaps) // segments)))
+    pieces = [(s, min(s + size, end)) for start, end in gaps for s in range(start, end, size)]
+    headers = {"If-Range": journal.if_range()} if journal.if_range() else {}
+    stop = threading.Event()
+    lock = threading.Lock()
+    location = total_size - sum(end - start for start, end in gaps)
+
+    with progress_bar(target, total_size, multibar) as bar, \
+         open(target, 'r+b' if resumed else 'wb') as f:
+        f.truncate(total_size)
+        write = write_at(f)
+        digester = Digester(algorithm, target) if algorithm else None
+        bar.update(location)
+
+        def fetch(start, end):
+            nonlocal location
+
+            if stop.is_set():
+                return
+
+            r = session.get(url, headers={"Range": f"bytes={start}-{end - 1}", **headers}, stream=True)
+            r.raise_for_status()
+
+            if r.status_code != 206:
+                r.close()
+                raise requests.HTTPError(f"asked for bytes {start}-{end - 1} of {url}, got status {r.status_code}, "
+                                         f"has it changed?")
+
+            offset = start
+
+            def sink(view):
+                nonlocal offset, location
+
+                write(view, offset)
+                journal.add(offset, offset + len(view), f.fileno())
+                offset += len(view)
+
+                with lock:
+                    location += len(view)
                     bar.update(location)
 
-                f.write(ch)
-                location += len(ch)
+                if digester:
+                    digester.advance(journal.contiguous())
 
+            with r:
+                stream_into(r, sink, stop)
+
+            if stop.is_set():
+                return
+
+            if offset != end:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"range {start}-{end - 1} of {url} ended early at {offset}")
+
+        try:
+            with ThreadPoolExecutor(max(1, min(segments, len(pieces)))) as pool:
+                futures = [pool.submit(fetch, start, end) for start, end in pieces]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            journal.save(f.fileno())
+
+        if digester:
+            digester.advance(total_size, wait=True)
+
+    journal.remove()
+
+    return digester.hexdigest() if digester else None
+
+
+def target_for(url, directory=".", taken=None):
+    """
+    a filename in directory for url, from the last part of its path.
+    names already in taken get -1, -2, ... added, and the result is added to taken
+    """
+    name = url.split('?')[0].rstrip('/').split('/')[-1] or "index.html"
+    stem, ext = os.path.splitext(name)
+    target = os.path.join(directory, name)
+    n = 0
+
+    while taken is not None and target in taken:
+        n += 1
+        target = os.path.join(directory, f"{stem}-{n}{ext}")
+
+    if taken is not None:
+        taken.add(target)
+
+    return target
+
+
+def download_many(urls, concurrency=CONCURRENCY, per_host=PER_HOST, retries=RETRIES, backoff=BACKOFF,
+                  directory=".", segments=1, session=None):
+    """
+    downloads every url into directory, concurrency of them at once and no
+    more than per_host from the same host, showing a line per file and an
+    overall bar.  a file that fails is retried after backoff seconds,
+    doubling each time, without holding up the others; ranged downloads
+    pick up from their journal.
+
+    :param urls: urls to fetch, or (url, target) pairs
+    :param segments: ranges per file, see download()
+    :return: one dict per url with url, target, bytes, seconds, attempts, and error (None if it worked)
+    """
+
+    taken = set()
+    jobs = []
+    for url in urls:
+        url, target = url if isinstance(url, tuple) else (url, target_for(url, directory, taken))
+        jobs.append({"url": url, "target": target, "bytes": 0, "seconds": 0.0, "attempts": 0, "error": None})
+
+    session = session or make_session(max(concurrency, per_host) * segments)
+    multibar = progressbar.MultiBar(sort_key=progressbar.SortKey.CREATED, remove_finished=2.0)
+    overall = progressbar.ProgressBar(max_value=len(jobs), widgets=[
+        progressbar.Counter("%(value)d"), f"/{len(jobs)} files ",
+        progressbar.Bar(), ' ', progressbar.Timer(),
+    ])
+    multibar["all"] = overall
+
+    waiting = [(0.0, i) for i in range(len(jobs))]     # heap of (when it may start, job index)
+    running = {}                                        # future -> job index
+    active = {}                                         # host -> downloads running
+    start = time.perf_counter()
+
+    def fetch(job):
+        job["attempts"] += 1
+        began = time.perf_counter()
+        download(job["url"], job["target"], segments, session, multibar=multibar)
+        job["seconds"] += time.perf_counter() - began
+        job["bytes"] = os.path.getsize(job["target"])
+
+    with multibar, ThreadPoolExecutor(concurrency) as pool:
+        overall.start()
+
+        while waiting or running:
+            now = time.perf_counter()
+            deferred = []
+
+            while waiting and waiting[0][0] <= now and len(running) < concurrency:
+                when, i = heapq.heappop(waiting)
+                host = urllib.parse.urlsplit(jobs[i]["url"]).netloc
+
+                if active.get(host, 0) >= per_host:
+                    deferred.append((when, i))
+                    continue
+
+                active[host] = active.get(host, 0) + 1
+                running[pool.submit(fetch, jobs[i])] = i
+
+            for item in deferred:
+                heapq.heappush(waiting, item)
+
+            # wake up for whichever comes first: a download ending, or a retry coming due
+            due = [when for when, i in waiting if when > now]
+            timeout = min(due) - now if due else None
+
+            if not running:
+                time.sleep(timeout or 0)
+                continue
+
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                i = running.pop(future)
+                job = jobs[i]
+                host = urllib.parse.urlsplit(job["url"]).netloc
+                active[host] -= 1
+
+                error = future.exception()
+                if error is None:
+                    job["error"] = None
+                    overall.increment()
+                elif job["attempts"] <= retries and retryable(error):
+                    job["error"] = str(error)
+                    heapq.heappush(waiting, (time.perf_counter() + backoff * 2 ** (job["attempts"] - 1), i))
+                else:
+                    job["error"] = str(error)
+                    overall.increment()
+
+        overall.finish()
+
+    summary(jobs, time.perf_counter() - start)
+
+    return jobs
+
+
+def retryable(error):
+    """is error worth another try: network trouble and server errors are, "not found" and such are not"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status in (408, 429)
+
+    return isinstance(error, (requests.RequestException, OSError))
+
+
+def summary(jobs, elapsed, file=None):
+    """prints how download_many() went"""
+    ok = [job for job in jobs if job["error"] is None]
+    failed = [job for job in jobs if job["error"] is not None]
+    total = sum(job["bytes"] for job in ok)
+    rate = total / elapsed if elapsed else 0.0
+
+    print(f"{len(ok)} of {len(jobs)} files, {total} bytes in {elapsed:.1f} seconds, {rate / 1024 / 1024:.1f} MiB/s, "
+          f"{sum(job['attempts'] - 1 for job in jobs)} retries", file=file)
+
+    for job in failed:
+        print(f"[error] {job['url']}: failed after {job['attempts']} attempts: {job['error']}", file=file)
+
+
+def main():
+    global Verbose
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("url", nargs="?", default=
+                    "https://gis.data.cnra.ca.gov/datasets/CALFIRE-Forestry::2000s-2.geojson"
+                    "?outSR=%7B%22latestWkid%22%3A3857%2C%22wkid%22%3A102100%7D")
+    ap.add_argument("target", nargs="?", default=None)
+    ap.add_argument("--segments", type=int, default=None)
+    ap.add_argument("--digest", type=str, default=None)
+    ap.add_argument("--many", type=str, default=None)
+    ap.add_argument("--directory", type=str, default=".")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--per-host", type=int, default=PER_HOST)
+    ap.add_argument("--retries", type=int, default=RETRIES)
+    ap.add_argument("--verbose", action="store_true", default=False)
+    args = ap.parse_args()
+
+    Verbose = args.verbose
+
+    if args.many:
+        with open(args.many) as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+        os.makedirs(args.directory, exist_ok=True)
+        jobs = download_many(urls, args.concurrency, args.per_host, args.retries,
+                             directory=args.directory, segments=args.segments or 1)
+        exit(1 if any(job["error"] for job in jobs) else 0)
+
+    target = args.target or ("CALFIRE.geojson" if "CALFIRE" in args.url else args.url.split('/')[-1].split('?')[0])
+    algorithm, _, expected = (args.digest or "").partition(":")
+
+    if algorithm and algorithm not in hashlib.algorithms_available:
+        print(f"[error] unknown digest algorithm {algorithm}")
+        exit(1)
+
+    try:
+        digest = download(args.url, target, args.segments or SEGMENTS,
+                          algorithm=algorithm or None, expected=expected or None)
+    except ValueError as e:
+        print(f"[error] {e}")
+        exit(1)
+
+    if digest:
+        print(f"{digest}  {target}")
 
-if __name__ == "__main__":
-    download(
-        "https://gis.data.cnra.ca.gov/datasets/CALFIRE-Forestry::2000s-2.geojson?outSR=%7B%22latestWkid%22%3A3857%2C%22wkid%22%3A102100%7D",
-        "CALFIRE.geojson"
-    )
     """
     # a VERY large file to play with
     download(
@@ -66,3 +796,7 @@ if __name__ == "__main__":
         "yago3.1.7z"
     )
     """
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+    serve.py -- a local stand-in web server for trying out download.py
+
+    serves a directory like "python3 -m http.server" does, but understands
+    single HTTP Range requests (with If-Range, against the ETag or
+    Last-Modified it sends), and can pretend to be a less capable server
+
+    Usage:
+
+        python3 ./serve.py
+            [directory]         -- what to serve, default .
+            [--port n]          -- default 8000, 0 picks a free port
+            [--bind address]    -- default 127.0.0.1
+            [--no-ranges]       -- ignore Range headers and always send the whole file
+            [--no-length]       -- don't send content-length, end responses by closing the connection
+"""
+
+import argparse
+import functools
+import http.server
+import os
+import re
+import sys
+import threading
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    SimpleHTTPRequestHandler that answers "Range: bytes=..." with 206 Partial
+    Content.  ranges and length are turned off per server by serve()
+    """
+
+    protocol_version = "HTTP/1.1"
+    ranges = True
+    length = True
+
+    def send_head(self):
+        self.remaining = None
+        path = self.translate_path(self.path)
+
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        start, end = 0, size - 1
+        partial = False
+        etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+        last_modified = self.date_time_string(st.st_mtime)
+
+        # If-Range: only send the range if the file is still the one the client has part of
+        if_range = self.headers.get("If-Range")
+        current = if_range is None or if_range in (etag, last_modified)
+
+        if self.ranges and current and "Range" in self.headers:
+            m = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers["Range"].strip())
+
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                else:
+                    start = max(size - int(m.group(2)), 0)
+
+                if start >= size or start > end:
+                    f.close()
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return None
+
+                partial = True
+
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("ETag", etag)
+
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if self.length:
+            self.send_header("Content-Length", str(end - start + 1))
+        else:
+            self.close_connection = True
+
+        self.end_headers()
+
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "remaining", None)
+
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+
+        while remaining > 0:
+            buf = source.read(min(64 * 1024, remaining))
+            if not buf:
+                break
+            outputfile.write(buf)
+            remaining -= len(buf)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    verbose = False
+
+    def handle_error(self, request, client_address):
+        # clients hanging up mid-response is normal for an interrupted download
+        if self.verbose or not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(directory=".", port=0, bind="127.0.0.1", ranges=True, length=True, verbose=False):
+    """
+    starts a threaded server for directory in a background thread
+
+    :param directory: what to serve
+    :param port: port to listen on, 0 picks a free one
+    :param ranges: honor Range requests
+    :param length: send content-length
+    :return: (server, base url), call server.shutdown() when done
+    """
+
+    handler = type("Handler", (RangeRequestHandler,), {"ranges": ranges, "length": length})
+    server = Server((bind, port), functools.partial(handler, directory=directory))
+    server.verbose = verbose
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("directory", nargs="?", default=".")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--bind", type=str, default="127.0.0.1")
+    ap.add_argument("--no-ranges", action="store_true", default=False)
+    ap.add_argument("--no-length", action="store_true", default=False)
+    args = ap.parse_args()
+
+    server, url = serve(args.directory, args.port, args.bind,
+                        ranges=not args.no_ranges, length=not args.no_length, verbose=True)
+    print(f"serving {args.directory} at {url}, ^C to stop")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+    throttle.py -- progress updates for hot loops
+
+    bar.update() costs microseconds, far more than the body of a tight loop.
+    Throttled stands in for a bar and only passes updates on every INTERVAL
+    seconds; in between, update() is a store and a countdown.  the clock is
+    only read every "stride" calls, with the stride tuned so it is read a
+    few times per interval whatever the loop's speed.
+
+        with Throttled(progressbar.ProgressBar(max_value=m)) as progress:
+            for i in range(m):
+                ...
+                progress.update(i)
+
+    or, for a plain for loop over an iterable:
+
+        for item in throttled(items, progressbar.ProgressBar(max_value=len(items))):
+            ...
+
+    run it to see what that costs on a tight loop next to the raw loop,
+    calling bar.update() every time, and the old "every 100th" trick:
+
+        python3 ./throttle.py [--n iterations]
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+import progressbar
+
+INTERVAL = 0.1          # seconds between real updates, 10 Hz
+CHECKS = 4              # clock reads per interval the stride aims for
+
+
+class Throttled:
+    """
+    wraps bar so update(value) only reaches it every interval seconds, and
+    once more with the last value when we finish
+    """
+
+    __slots__ = ["bar", "interval", "value", "stride", "countdown", "checked", "next"]
+
+    def __init__(self, bar, interval=INTERVAL):
+        self.bar = bar
+        self.interval = interval
+        self.value = 0
+        self.stride = 1
+        self.countdown = 1
+        self.checked = time.perf_counter()
+        self.next = self.checked
+
+    def __enter__(self):
+        self.bar.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+        return False
+
+    def update(self, value):
+        self.value = value
+        self.countdown -= 1
+
+        if self.countdown <= 0:
+            self._check()
+
+    def increment(self, n=1):
+        self.update(self.value + n)
+
+    def _check(self):
+        now = time.perf_counter()
+
+        # pick the stride so the next clock read is about interval / CHECKS away
+        if now > self.checked:
+            rate = self.stride / (now - self.checked)
+            self.stride = max(1, int(rate * self.interval / CHECKS))
+        self.checked = now
+        self.countdown = self.stride
+
+        if now >= self.next:
+            self.next = now + self.interval
+            self.bar.update(self.value)
+
+    def finish(self):
+        self.bar.update(self.value)
+        self.bar.finish()
+
+
+def throttled(iterable, bar, interval=INTERVAL, start=0):
+    """
+    iterates over the items of iterable, moving bar along by one per item, but
+    only really updating it every interval seconds.  items are taken a
+    stride at a time through itertools.islice, which pulls each one only
+    when the loop asks for it, so a loop that breaks out early leaves the
+    rest of iterable untouched.  the count is only added up per stride.
+    """
+    it = iter(iterable)
+    progress = Throttled(bar, interval)
+    progress.value = start
+
+    with progress:
+        while True:
+            n = progress.stride
+            done = 0
+
+            try:
+                for done, item in enumerate(itertools.islice(it, n), 1):
+                    yield item
+            finally:
+                # also when the loop breaks out part way through the stride
+                progress.value += done
+
+            if done < n:
+                return
+
+            progress._check()
+
+
+def bench(n):
+    """per iteration cost of each way to drive a bar through an empty loop of n"""
+
+    def bar():
+        return progressbar.ProgressBar(max_value=n, fd=devnull)
+
+    def raw():
+        for i in range(n):
+            pass
+
+    def every():
+        with bar() as b:
+            for i in range(n):
+                b.update(i)
+
+    def modulo():
+        with bar() as b:
+            for i in range(n):
+                if i % 100 == 0:
+                    b.update(i)
+
+    def throttle():
+        with Throttled(bar()) as b:
+            for i in range(n):
+                b.update(i)
+
+    def iterator():
+        for i in throttled(range(n), bar()):
+            pass
+
+    with open(os.devnull, "w") as devnull:
+        for name, fn in [("raw loop", raw), ("update every time", every), ("update every 100th", modulo),
+                         ("Throttled.update", throttle), ("throttled() iterator", iterator)]:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:22} {elapsed:8.3f} seconds  {elapsed / n * 1e9:8.1f} ns per iteration")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2_000_000)
+    args = ap.parse_args()
+
+    bench(args.n)
+
+
+if __name__ == "__main__":
+    main()